@@ -0,0 +1,113 @@
+"""
+  Batched evaluation with NumPy for scoring many positions at once (e.g. labeling datasets offline).
+  Positions are packed into an (N, 64) array of piece codes and scored with table lookups and sums over the
+  whole batch. Scores are the same floats SmartMoveFinder.scoreBoard returns for each position: material plus
+  piece-square sums (both integers) combined with the same formula, so they match exactly.
+
+  python BatchEval.py positions.fen [--batch-size 4096]     one FEN per line in, "score fen" per line out
+"""
+
+import argparse
+import sys
+
+import numpy as np
+
+import ChessEngine
+import SmartMoveFinder
+
+PIECES = ("--", "wp", "wN", "wB", "wR", "wQ", "wK", "bp", "bN", "bB", "bR", "bQ", "bK")
+PIECE_CODES = {piece: code for code, piece in enumerate(PIECES)}
+
+# code -> signed material, code x square -> signed piece-square bonus (white minus black, as in ChessEngine)
+MATERIAL = np.zeros(len(PIECES), dtype=np.int64)
+POSITION = np.zeros((len(PIECES), 64), dtype=np.int64)
+for _code, _piece in enumerate(PIECES[1:], 1):
+    MATERIAL[_code] = ChessEngine.signedPieceScores[_piece]
+    POSITION[_code] = ChessEngine.signedPositionScores[_piece]
+
+# two ASCII characters of a square ("wN") -> piece code, so whole boards are decoded in one lookup
+_CHARACTER_CODES = np.zeros(1 << 16, dtype=np.int8)
+for _code, _piece in enumerate(PIECES):
+    _CHARACTER_CODES[ord(_piece[0]) << 8 | ord(_piece[1])] = _code
+_SQUARES = np.arange(64)
+
+
+def packBoards(boards):
+    """
+    (N, 64) int8 array of piece codes (index row*8 + col) for a list of GameState.board style boards.
+    """
+    text = "".join(["".join(map("".join, board)) for board in boards])
+    characters = np.frombuffer(text.encode("ascii"), dtype=np.uint8).reshape(len(boards), 64, 2).astype(np.int32)
+    return _CHARACTER_CODES[characters[:, :, 0] << 8 | characters[:, :, 1]]
+
+
+def evaluateBatch(squares, whiteToMove=None, checkmate=None, stalemate=None):
+    """
+    Scores (float64, white's point of view) for an (N, 64) array of piece codes. The optional boolean arrays
+    mark positions that are over: checkmate scores -CHECKMATE when white is to move (CHECKMATE otherwise),
+    stalemate scores STALEMATE, like scoreBoard.
+    """
+    squares = np.asarray(squares)
+    material = MATERIAL[squares].sum(axis=1)
+    position = POSITION[squares, _SQUARES].sum(axis=1)
+    scores = material + position * SmartMoveFinder.POSITION_WEIGHT
+    if stalemate is not None:
+        scores[np.asarray(stalemate, dtype=bool)] = SmartMoveFinder.STALEMATE
+    if checkmate is not None:
+        checkmate = np.asarray(checkmate, dtype=bool)
+        mateScores = np.where(np.asarray(whiteToMove, dtype=bool), -SmartMoveFinder.CHECKMATE, SmartMoveFinder.CHECKMATE)
+        scores[checkmate] = mateScores[checkmate]
+    return scores
+
+
+def scoreStates(states):
+    """
+    scoreBoard for every GameState in a list, in one batch. As with scoreBoard, checkmate and stalemate are
+    taken from the flags the last getValidMoves call left on each state.
+    """
+    squares = packBoards([gs.board for gs in states])
+    return evaluateBatch(squares,
+                         np.fromiter((gs.whiteToMove for gs in states), dtype=bool, count=len(states)),
+                         np.fromiter((gs.checkmate for gs in states), dtype=bool, count=len(states)),
+                         np.fromiter((gs.stalemate for gs in states), dtype=bool, count=len(states)))
+
+
+def scoreFens(fens):
+    """
+    Scores for a list of FEN strings. Each position's legal moves are generated to detect checkmate and stalemate.
+    """
+    states = []
+    for fen in fens:
+        gs = ChessEngine.GameState()
+        gs.loadFen(fen)
+        gs.getValidMoves()
+        states.append(gs)
+    return scoreStates(states)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score a file of FEN positions with the engine evaluation")
+    parser.add_argument("fens", help="file with one FEN per line")
+    parser.add_argument("--batch-size", type=int, default=4096, help="positions scored per batch")
+    args = parser.parse_args(argv)
+
+    def printScores(batch):
+        for fen, score in zip(batch, scoreFens(batch)):
+            print("%r %s" % (float(score), fen))
+
+    with open(args.fens) as fenFile:
+        batch = []
+        for line in fenFile:
+            line = line.strip()
+            if line:
+                batch.append(line)
+            if len(batch) == args.batch_size:
+                printScores(batch)
+                batch = []
+        if batch:
+            printScores(batch)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
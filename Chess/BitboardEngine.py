@@ -0,0 +1,362 @@
+"""
+  Bitboard backed version of ChessEngine.GameState.
+  Every piece type and color has its own 64-bit integer with one bit per square, so move generation
+  works on whole sets of squares at once instead of walking the 8x8 list square by square.
+  It keeps the same makeMove / undoMove / getValidMoves API (and keeps self.board in sync for the UI
+  and for Move objects), so it can be dropped in anywhere a GameState is used.
+
+  Squares are numbered row * 8 + col, so a8 = 0 and h1 = 63, matching the row/col layout of the board.
+"""
+
+import ChessEngine
+from ChessEngine import Move
+
+PIECES = ("wp", "wN", "wB", "wR", "wQ", "wK", "bp", "bN", "bB", "bR", "bQ", "bK")
+
+FULL_BOARD = (1 << 64) - 1
+FILE_A = sum(1 << (r * 8) for r in range(8))
+FILE_H = FILE_A << 7
+
+# same order as GameState.checkForPinsAndChecks: 4 orthogonal directions, then 4 diagonals
+DIRECTIONS = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))
+
+
+def squareBit(r, c):
+    return 1 << (r * 8 + c)
+
+
+def _buildJumpTable(offsets):
+    table = []
+    for sq in range(64):
+        r, c = divmod(sq, 8)
+        mask = 0
+        for dr, dc in offsets:
+            if 0 <= r + dr < 8 and 0 <= c + dc < 8:
+                mask |= squareBit(r + dr, c + dc)
+        table.append(mask)
+    return table
+
+
+def _buildRays():
+    rays = []
+    for dr, dc in DIRECTIONS:
+        dirRays = []
+        for sq in range(64):
+            r, c = divmod(sq, 8)
+            mask = 0
+            r, c = r + dr, c + dc
+            while 0 <= r < 8 and 0 <= c < 8:
+                mask |= squareBit(r, c)
+                r, c = r + dr, c + dc
+            dirRays.append(mask)
+        rays.append(dirRays)
+    return rays
+
+
+KNIGHT_ATTACKS = _buildJumpTable(((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)))
+KING_ATTACKS = _buildJumpTable(((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)))
+PAWN_ATTACKS = {"w": _buildJumpTable(((-1, -1), (-1, 1))), "b": _buildJumpTable(((1, -1), (1, 1)))}
+RAYS = _buildRays()
+# rays going towards higher square numbers meet their nearest blocker at the lowest set bit
+RAY_IS_POSITIVE = tuple(dr * 8 + dc > 0 for dr, dc in DIRECTIONS)
+
+
+def nearestBlocker(direction, blockers):
+    if RAY_IS_POSITIVE[direction]:
+        return (blockers & -blockers).bit_length() - 1
+    return blockers.bit_length() - 1
+
+
+def rayAttacks(direction, sq, occupied):
+    """
+    Squares a slider on sq sees in one direction, up to and including the first blocker.
+    """
+    ray = RAYS[direction][sq]
+    blockers = ray & occupied
+    if blockers:
+        ray ^= RAYS[direction][nearestBlocker(direction, blockers)]
+    return ray
+
+
+def rookAttacks(sq, occupied):
+    return (rayAttacks(0, sq, occupied) | rayAttacks(1, sq, occupied) |
+            rayAttacks(2, sq, occupied) | rayAttacks(3, sq, occupied))
+
+
+def bishopAttacks(sq, occupied):
+    return (rayAttacks(4, sq, occupied) | rayAttacks(5, sq, occupied) |
+            rayAttacks(6, sq, occupied) | rayAttacks(7, sq, occupied))
+
+
+def iterSquares(bitboard):
+    """
+    Yields the square number of every set bit, lowest first.
+    """
+    while bitboard:
+        lowest = bitboard & -bitboard
+        yield lowest.bit_length() - 1
+        bitboard ^= lowest
+
+
+class BitboardGameState(ChessEngine.GameState):
+    def __init__( self, fen=None ):
+        super().__init__(fen)
+        self.bitboards = {}
+        self.colorBitboards = {}
+        self.loadBitboards()
+
+    def loadBitboards( self ):
+        """
+        Rebuilds all bitboards from self.board. Needed after the board list is edited directly.
+        """
+        self.bitboards = {piece: 0 for piece in PIECES}
+        self.colorBitboards = {"w": 0, "b": 0}
+        for r in range(8):
+            for c in range(8):
+                piece = self.board[r][c]
+                if piece != "--":
+                    self.bitboards[piece] |= squareBit(r, c)
+                    self.colorBitboards[piece[0]] |= squareBit(r, c)
+
+    def loadFen( self, fen ):
+        super().loadFen(fen)
+        self.loadBitboards()
+
+    def makeMove( self, move ):
+        super().makeMove(move)
+        startBit = squareBit(move.startRow, move.startCol)
+        endBit = squareBit(move.endRow, move.endCol)
+        color = move.pieceMoved[0]
+        self.bitboards[move.pieceMoved] ^= startBit
+        self.bitboards[self.board[move.endRow][move.endCol]] |= endBit      # promoted piece if promotion
+        self.colorBitboards[color] ^= startBit | endBit
+        if move.pieceCaptured != "--":
+            captureBit = squareBit(move.startRow, move.endCol) if move.isEnpassantMove else endBit
+            self.bitboards[move.pieceCaptured] ^= captureBit
+            self.colorBitboards[move.pieceCaptured[0]] ^= captureBit
+
+    def undoMove( self ):
+        if len(self.movelog) != 0:
+            move = self.movelog[-1]
+            placedPiece = self.board[move.endRow][move.endCol]
+            startBit = squareBit(move.startRow, move.startCol)
+            endBit = squareBit(move.endRow, move.endCol)
+            self.bitboards[placedPiece] ^= endBit
+            self.bitboards[move.pieceMoved] |= startBit
+            self.colorBitboards[move.pieceMoved[0]] ^= startBit | endBit
+            if move.pieceCaptured != "--":
+                captureBit = squareBit(move.startRow, move.endCol) if move.isEnpassantMove else endBit
+                self.bitboards[move.pieceCaptured] |= captureBit
+                self.colorBitboards[move.pieceCaptured[0]] |= captureBit
+        super().undoMove()
+
+    def attackedSquares( self, color, occupied ):
+        """
+        Every square attacked by the pieces of color, with sliders blocked by occupied.
+        """
+        bb = self.bitboards
+        if color == "w":
+            pawns = bb["wp"]
+            attacks = ((pawns & ~FILE_A) >> 9) | ((pawns & ~FILE_H) >> 7)
+        else:
+            pawns = bb["bp"]
+            attacks = (((pawns & ~FILE_A) << 7) | ((pawns & ~FILE_H) << 9)) & FULL_BOARD
+        for sq in iterSquares(bb[color + "N"]):
+            attacks |= KNIGHT_ATTACKS[sq]
+        for sq in iterSquares(bb[color + "B"] | bb[color + "Q"]):
+            attacks |= bishopAttacks(sq, occupied)
+        for sq in iterSquares(bb[color + "R"] | bb[color + "Q"]):
+            attacks |= rookAttacks(sq, occupied)
+        for sq in iterSquares(bb[color + "K"]):
+            attacks |= KING_ATTACKS[sq]
+        return attacks
+
+    def checkForPinsAndChecks( self ):
+        """
+        Same result format as GameState.checkForPinsAndChecks: (inCheck, pins, checks), where pins and checks
+        hold (row, col, dirRow, dirCol) tuples with the direction pointing away from the king.
+        """
+        pins = []
+        checks = []
+        allyColor = "w" if self.whiteToMove else "b"
+        enemyColor = "b" if self.whiteToMove else "w"
+        kingRow, kingCol = self.whiteKingLocation if self.whiteToMove else self.blackKingLocation
+        kingSq = kingRow * 8 + kingCol
+        bb = self.bitboards
+        allies = self.colorBitboards[allyColor]
+        occupied = allies | self.colorBitboards[enemyColor]
+        rookLike = bb[enemyColor + "R"] | bb[enemyColor + "Q"]
+        bishopLike = bb[enemyColor + "B"] | bb[enemyColor + "Q"]
+
+        for j in range(8):
+            blockers = RAYS[j][kingSq] & occupied
+            if not blockers:
+                continue
+            sliders = rookLike if j < 4 else bishopLike
+            first = nearestBlocker(j, blockers)
+            firstBit = 1 << first
+            if firstBit & allies:
+                blockers ^= firstBit
+                if blockers:
+                    second = nearestBlocker(j, blockers)
+                    if (1 << second) & sliders:
+                        pins.append((first // 8, first % 8, DIRECTIONS[j][0], DIRECTIONS[j][1]))
+            elif firstBit & sliders:
+                checks.append((first // 8, first % 8, DIRECTIONS[j][0], DIRECTIONS[j][1]))
+
+        for sq in iterSquares(PAWN_ATTACKS[allyColor][kingSq] & bb[enemyColor + "p"]):
+            checks.append((sq // 8, sq % 8, sq // 8 - kingRow, sq % 8 - kingCol))
+        for sq in iterSquares(KNIGHT_ATTACKS[kingSq] & bb[enemyColor + "N"]):
+            checks.append((sq // 8, sq % 8, sq // 8 - kingRow, sq % 8 - kingCol))
+        return len(checks) > 0, pins, checks
+
+    def getAllPossibleMoves( self, capturesOnly=False ):
+        """
+        All moves without considering checks, pins are already applied.
+        """
+        moves = []
+        color = "w" if self.whiteToMove else "b"
+        bb = self.bitboards
+        for piece in ("p", "N", "B", "R", "Q", "K"):
+            generate = self.moveFunctions[piece]
+            for sq in iterSquares(bb[color + piece]):
+                generate(sq // 8, sq % 8, moves, capturesOnly)
+        return moves
+
+    def getCheckEvasions( self, kingRow, kingCol, check, moves ):
+        """
+        Legal moves out of a single check. Every piece but the king is limited to one mask: the checker's square
+        plus, for a slider, the squares between it and the king. Pinned pieces are skipped, they can never
+        block or capture a checker.
+        """
+        color = "w" if self.whiteToMove else "b"
+        bb = self.bitboards
+        kingSq = kingRow * 8 + kingCol
+        checkSq = check[0] * 8 + check[1]
+        checkBit = 1 << checkSq
+        if self.board[check[0]][check[1]][1] in ("N", "p"):
+            checkMask = checkBit
+        else:
+            j = DIRECTIONS.index((check[2], check[3]))
+            checkMask = RAYS[j][kingSq] ^ RAYS[j][checkSq]                  # between the two, and the checker
+        pinned = 0
+        for pin in self.pins:
+            pinned |= squareBit(pin[0], pin[1])
+        movable = ~pinned
+        occupied = self.colorBitboards["w"] | self.colorBitboards["b"]
+
+        for sq in iterSquares(bb[color + "N"] & movable):
+            self.addMoves(sq // 8, sq % 8, KNIGHT_ATTACKS[sq] & checkMask, moves)
+        for sq in iterSquares((bb[color + "B"] | bb[color + "Q"]) & movable):
+            self.addMoves(sq // 8, sq % 8, bishopAttacks(sq, occupied) & checkMask, moves)
+        for sq in iterSquares((bb[color + "R"] | bb[color + "Q"]) & movable):
+            self.addMoves(sq // 8, sq % 8, rookAttacks(sq, occupied) & checkMask, moves)
+
+        step, startRow = (-8, 6) if self.whiteToMove else (8, 1)
+        epBit = squareBit(*self.enpassantPossible) if self.enpassantPossible != () else 0
+        if epBit and not (epBit & checkMask or (checkBit & bb["bp" if self.whiteToMove else "wp"]
+                                                and checkSq + step == self.enpassantPossible[0] * 8 + self.enpassantPossible[1])):
+            epBit = 0                                                       # en passant neither blocks nor takes the checker
+        for sq in iterSquares(bb[color + "p"] & movable):
+            r, c = sq // 8, sq % 8
+            targets = PAWN_ATTACKS[color][sq] & checkBit
+            oneStep = 1 << (sq + step)
+            if not oneStep & occupied:
+                targets |= oneStep & checkMask
+                if r == startRow and not (1 << (sq + 2 * step)) & occupied:
+                    targets |= (1 << (sq + 2 * step)) & checkMask
+            self.addMoves(r, c, targets, moves)
+            if epBit & PAWN_ATTACKS[color][sq] and not self.enpassantExposesKing(r, c, self.enpassantPossible[1]):
+                moves.append(Move((r, c), self.enpassantPossible, self.board, isEnpassantMove=True))
+        self.getKingMoves(kingRow, kingCol, moves)
+
+    def pinMask( self, r, c ):
+        """
+        Squares a piece on (r, c) may move to without leaving its pin line; all squares if it is not pinned.
+        """
+        for pin in self.pins:
+            if pin[0] == r and pin[1] == c:
+                return self.pinLine(r, c, pin[2], pin[3])
+        return FULL_BOARD
+
+    def pinLine( self, r, c, dirRow, dirCol ):
+        j = DIRECTIONS.index((dirRow, dirCol))
+        k = DIRECTIONS.index((-dirRow, -dirCol))
+        sq = r * 8 + c
+        return RAYS[j][sq] | RAYS[k][sq]
+
+    def addMoves( self, r, c, targets, moves ):
+        for sq in iterSquares(targets):
+            moves.append(Move((r, c), (sq // 8, sq % 8), self.board))
+
+    def getPawnMoves( self, r, c, moves, capturesOnly=False ):
+        sq = r * 8 + c
+        allowed = self.pinMask(r, c)
+        if self.whiteToMove:
+            color, enemyColor, step, startRow = "w", "b", -8, 6
+        else:
+            color, enemyColor, step, startRow = "b", "w", 8, 1
+        empty = ~(self.colorBitboards["w"] | self.colorBitboards["b"])
+        targets = 0
+        oneStep = 1 << (sq + step)
+        promotionRow = 0 if self.whiteToMove else 7
+        if oneStep & empty and (not capturesOnly or r + step // 8 == promotionRow):      # quiet pushes only if promoting
+            targets |= oneStep
+            if r == startRow and (1 << (sq + 2 * step)) & empty:
+                targets |= 1 << (sq + 2 * step)
+        targets |= PAWN_ATTACKS[color][sq] & self.colorBitboards[enemyColor]
+        self.addMoves(r, c, targets & allowed, moves)
+        if self.enpassantPossible != ():
+            epRow, epCol = self.enpassantPossible
+            epBit = squareBit(epRow, epCol)
+            if epBit & PAWN_ATTACKS[color][sq] & allowed and not self.enpassantExposesKing(r, c, epCol):
+                moves.append(Move((r, c), (epRow, epCol), self.board, isEnpassantMove=True))
+
+    def enpassantExposesKing( self, r, c, captureCol ):
+        """
+        Removes both pawns from the rank and looks for an enemy rook or queen along it from the king.
+        """
+        kingRow, kingCol = self.whiteKingLocation if self.whiteToMove else self.blackKingLocation
+        if kingRow != r:
+            return False
+        enemyColor = "b" if self.whiteToMove else "w"
+        occupied = (self.colorBitboards["w"] | self.colorBitboards["b"]) & ~squareBit(r, c) & ~squareBit(r, captureCol)
+        direction = 3 if captureCol > kingCol else 1
+        attacks = rayAttacks(direction, kingRow * 8 + kingCol, occupied)
+        return bool(attacks & (self.bitboards[enemyColor + "R"] | self.bitboards[enemyColor + "Q"]))
+
+    def targetSquares( self, capturesOnly ):
+        """
+        Squares a piece of the side to move may land on: anything but its own pieces, or only enemy pieces.
+        """
+        if capturesOnly:
+            return self.colorBitboards["b" if self.whiteToMove else "w"]
+        return ~self.colorBitboards["w" if self.whiteToMove else "b"] & FULL_BOARD
+
+    def getKnightMoves( self, r, c, moves, capturesOnly=False ):
+        if self.pinMask(r, c) != FULL_BOARD:                             # a pinned knight can never move
+            return
+        self.addMoves(r, c, KNIGHT_ATTACKS[r * 8 + c] & self.targetSquares(capturesOnly), moves)
+
+    def getSliderMoves( self, r, c, moves, attackFunction, capturesOnly ):
+        occupied = self.colorBitboards["w"] | self.colorBitboards["b"]
+        targets = attackFunction(r * 8 + c, occupied) & self.targetSquares(capturesOnly) & self.pinMask(r, c)
+        self.addMoves(r, c, targets, moves)
+
+    def getRookMoves( self, r, c, moves, capturesOnly=False ):
+        self.getSliderMoves(r, c, moves, rookAttacks, capturesOnly)
+
+    def getBishopMoves( self, r, c, moves, capturesOnly=False ):
+        self.getSliderMoves(r, c, moves, bishopAttacks, capturesOnly)
+
+    def getQueenMoves( self, r, c, moves, capturesOnly=False ):
+        self.getSliderMoves(r, c, moves, lambda sq, occupied: rookAttacks(sq, occupied) | bishopAttacks(sq, occupied),
+                            capturesOnly)
+
+    def getKingMoves( self, r, c, moves, capturesOnly=False ):
+        enemyColor = "b" if self.whiteToMove else "w"
+        kingBit = squareBit(r, c)
+        # the king is lifted off the board so sliders see through the square it is leaving
+        occupied = (self.colorBitboards["w"] | self.colorBitboards["b"]) ^ kingBit
+        attacked = self.attackedSquares(enemyColor, occupied)
+        self.addMoves(r, c, KING_ATTACKS[r * 8 + c] & self.targetSquares(capturesOnly) & ~attacked, moves)
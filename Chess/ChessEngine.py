@@ -3,14 +3,110 @@
   It will also be responsible for determining the valid moves at the current state.
   It will also keep move log.
 """
+import random
+
+"""
+  Zobrist keys: one random 64-bit number per piece per square, one for black to move and one per
+  en passant file. A position's key is the XOR of the numbers for everything that is true in it, so a
+  move only has to XOR in and out the few numbers it changes. Fixed seed so keys are the same every run.
+"""
+_zobristRandom = random.Random(20240613)
+zobristPieceKeys = {color + piece: [_zobristRandom.getrandbits(64) for sq in range(64)]
+                    for color in "wb" for piece in "pNBRQK"}
+zobristBlackToMoveKey = _zobristRandom.getrandbits(64)
+zobristEnpassantKeys = [_zobristRandom.getrandbits(64) for col in range(8)]
+
+"""
+  Evaluation terms kept up to date by makeMove/undoMove: material in pawns and piece-square bonuses in
+  tenths of a pawn, both summed as white minus black. Tables are from white's point of view with row 0 = rank 8;
+  black uses them mirrored.
+"""
+pieceScore = {"K":0 , "Q": 10 , "R" : 5 , "B" : 3 , "N" : 3, "p" : 1}
+
+knightScores = [[-5, -4, -3, -3, -3, -3, -4, -5],
+                [-4, -2,  0,  0,  0,  0, -2, -4],
+                [-3,  0,  1,  2,  2,  1,  0, -3],
+                [-3,  1,  2,  3,  3,  2,  1, -3],
+                [-3,  0,  2,  3,  3,  2,  0, -3],
+                [-3,  1,  1,  2,  2,  1,  1, -3],
+                [-4, -2,  0,  1,  1,  0, -2, -4],
+                [-5, -4, -3, -3, -3, -3, -4, -5]]
+
+bishopScores = [[-2, -1, -1, -1, -1, -1, -1, -2],
+                [-1,  0,  0,  0,  0,  0,  0, -1],
+                [-1,  0,  1,  1,  1,  1,  0, -1],
+                [-1,  1,  1,  2,  2,  1,  1, -1],
+                [-1,  0,  2,  2,  2,  2,  0, -1],
+                [-1,  2,  2,  2,  2,  2,  2, -1],
+                [-1,  1,  0,  0,  0,  0,  1, -1],
+                [-2, -1, -1, -1, -1, -1, -1, -2]]
+
+rookScores = [[ 0,  0,  0,  0,  0,  0,  0,  0],
+              [ 1,  2,  2,  2,  2,  2,  2,  1],
+              [-1,  0,  0,  0,  0,  0,  0, -1],
+              [-1,  0,  0,  0,  0,  0,  0, -1],
+              [-1,  0,  0,  0,  0,  0,  0, -1],
+              [-1,  0,  0,  0,  0,  0,  0, -1],
+              [-1,  0,  0,  0,  0,  0,  0, -1],
+              [ 0,  0,  0,  1,  1,  0,  0,  0]]
+
+queenScores = [[-2, -1, -1, -1, -1, -1, -1, -2],
+               [-1,  0,  0,  0,  0,  0,  0, -1],
+               [-1,  0,  1,  1,  1,  1,  0, -1],
+               [-1,  0,  1,  1,  1,  1,  0, -1],
+               [ 0,  0,  1,  1,  1,  1,  0, -1],
+               [-1,  1,  1,  1,  1,  1,  0, -1],
+               [-1,  0,  1,  0,  0,  0,  0, -1],
+               [-2, -1, -1, -1, -1, -1, -1, -2]]
+
+pawnScores = [[ 0,  0,  0,  0,  0,  0,  0,  0],
+              [ 8,  8,  8,  8,  8,  8,  8,  8],
+              [ 3,  3,  4,  5,  5,  4,  3,  3],
+              [ 1,  1,  2,  4,  4,  2,  1,  1],
+              [ 0,  0,  1,  3,  3,  1,  0,  0],
+              [ 1,  0, -1,  0,  0, -1,  0,  1],
+              [ 1,  1,  1, -2, -2,  1,  1,  1],
+              [ 0,  0,  0,  0,  0,  0,  0,  0]]
+
+kingScores = [[-3, -4, -4, -5, -5, -4, -4, -3],
+              [-3, -4, -4, -5, -5, -4, -4, -3],
+              [-3, -4, -4, -5, -5, -4, -4, -3],
+              [-3, -4, -4, -5, -5, -4, -4, -3],
+              [-2, -3, -3, -4, -4, -3, -3, -2],
+              [-1, -2, -2, -2, -2, -2, -2, -1],
+              [ 2,  2,  0,  0,  0,  0,  2,  2],
+              [ 2,  3,  1,  0,  0,  1,  3,  2]]
+
+piecePositionScores = {"N": knightScores, "B": bishopScores, "R": rookScores,
+                       "Q": queenScores, "p": pawnScores, "K": kingScores}
+
+#signed per piece so white adds and black subtracts; position tables flattened to index row*8 + col
+signedPieceScores = {color + piece: (1 if color == "w" else -1) * pieceScore[piece]
+                     for color in "wb" for piece in "pNBRQK"}
+signedPositionScores = {}
+for _piece, _table in piecePositionScores.items():
+    signedPositionScores["w" + _piece] = [_table[r][c] for r in range(8) for c in range(8)]
+    signedPositionScores["b" + _piece] = [-_table[7 - r][c] for r in range(8) for c in range(8)]
+
+
+def captureOrderScore(move):
+    """
+    Ordering score of a capture or promotion: most valuable victim first, then least valuable attacker (MVV-LVA).
+    """
+    victim = pieceScore[move.pieceCaptured[1]] if move.pieceCaptured != "--" else 0
+    if move.isPawnPromotion:
+        victim += pieceScore["Q"]
+    return victim * 100 - pieceScore[move.pieceMoved[1]]
+
 
 class GameState():
-    def __init__( self ):
+    def __init__( self, fen=None ):
         """
           2x2 List for 2d board of size 8x8
           Contains Color and type of the piece
           1st char of each element => Color
           2nd char => Type
+          Starts from the position in fen when one is given, otherwise from the initial position.
         """
 
         self.board = [
@@ -33,8 +129,148 @@ class GameState():
         self.checkmate = False
         self.stalemate = False
         self.enpassantPossible = () #coordinates for the square where en passant capture is possible
+        self.enpassantPossibleLog = [self.enpassantPossible]
+        self.pins = []
+        self.checks = []
+        self.zobristKey = self.computeZobristKey()
+        self.materialScore, self.positionScore = self.computeEvaluation()
+        self.pieceCount = 32                                            # kings included, kept up to date by makeMove/undoMove
+        self.fenClocks = (0, 1)                                         # halfmove clock and move number before the move log
+        self.halfmoveClock = 0                                          # plies since the last capture or pawn move
+        self.halfmoveClockLog = [self.halfmoveClock]
+        self.positionCounts = {self.zobristKey: 1}                      # zobristKey -> times on the board in this game line
+        if fen is not None:
+            self.loadFen(fen)
+
+    def loadFen( self, fen ):
+        """
+          Sets up the position described by a FEN string and clears the move log.
+          Castling rights are ignored since the engine does not play castling.
+        """
+        fields = fen.split()
+        self.board = []
+        for rank in fields[0].split("/"):
+            row = []
+            for char in rank:
+                if char.isdigit():
+                    row.extend(["--"] * int(char))
+                else:
+                    color = "w" if char.isupper() else "b"
+                    pieceType = "p" if char in "pP" else char.upper()
+                    if pieceType == "K":
+                        if color == "w":
+                            self.whiteKingLocation = (len(self.board), len(row))
+                        else:
+                            self.blackKingLocation = (len(self.board), len(row))
+                    row.append(color + pieceType)
+            if len(row) != 8:
+                raise ValueError("bad FEN rank: " + rank)
+            self.board.append(row)
+        if len(self.board) != 8:
+            raise ValueError("bad FEN board: " + fields[0])
+        self.whiteToMove = len(fields) < 2 or fields[1] == "w"
+        if len(fields) > 3 and fields[3] != "-":
+            self.enpassantPossible = (Move.ranksToRows[fields[3][1]], Move.filesToCols[fields[3][0]])
+        else:
+            self.enpassantPossible = ()
+        self.enpassantPossibleLog = [self.enpassantPossible]
+        self.movelog = []
+        self.inCheck = False
+        self.checkmate = False
+        self.stalemate = False
         self.pins = []
         self.checks = []
+        self.zobristKey = self.computeZobristKey()
+        self.materialScore, self.positionScore = self.computeEvaluation()
+        self.pieceCount = sum(1 for row in self.board for square in row if square != "--")
+        self.fenClocks = (int(fields[4]) if len(fields) > 4 else 0, int(fields[5]) if len(fields) > 5 else 1)
+        self.halfmoveClock = self.fenClocks[0]
+        self.halfmoveClockLog = [self.halfmoveClock]
+        self.positionCounts = {self.zobristKey: 1}
+
+    def getFen( self ):
+        """
+          FEN string of the current position. The castling field is always "-" since the engine does not castle;
+          the move number continues from the loaded FEN's through the move log.
+        """
+        ranks = []
+        for row in self.board:
+            rank = ""
+            empty = 0
+            for square in row:
+                if square == "--":
+                    empty += 1
+                    continue
+                if empty:
+                    rank += str(empty)
+                    empty = 0
+                rank += square[1].upper() if square[0] == "w" else square[1].lower()
+            ranks.append(rank + (str(empty) if empty else ""))
+        if self.enpassantPossible:
+            enpassant = Move.colsToFiles[self.enpassantPossible[1]] + Move.rowsToRanks[self.enpassantPossible[0]]
+        else:
+            enpassant = "-"
+        moveNumber = self.fenClocks[1] + sum(1 for move in self.movelog if move.pieceMoved[0] == "b")
+        return "%s %s - %s %d %d" % ("/".join(ranks), "w" if self.whiteToMove else "b", enpassant,
+                                     self.halfmoveClock, moveNumber)
+
+    def computeEvaluation( self ):
+        """
+        (material, piece-square) sums of the whole board from scratch, white minus black.
+        makeMove/undoMove keep self.materialScore and self.positionScore up to date incrementally.
+        """
+        material = 0
+        position = 0
+        for r in range(8):
+            for c in range(8):
+                piece = self.board[r][c]
+                if piece != "--":
+                    material += signedPieceScores[piece]
+                    position += signedPositionScores[piece][r*8 + c]
+        return material, position
+
+    def evaluationMoveDelta( self, move, placedPiece ):
+        """
+        Change of (material, piece-square) sums made by a move; undo subtracts it again.
+        """
+        material = signedPieceScores[placedPiece] - signedPieceScores[move.pieceMoved]     # non zero on promotion
+        position = (signedPositionScores[placedPiece][move.endRow*8 + move.endCol] -
+                    signedPositionScores[move.pieceMoved][move.startRow*8 + move.startCol])
+        if move.pieceCaptured != "--":
+            captureRow = move.startRow if move.isEnpassantMove else move.endRow
+            material -= signedPieceScores[move.pieceCaptured]
+            position -= signedPositionScores[move.pieceCaptured][captureRow*8 + move.endCol]
+        return material, position
+
+    def computeZobristKey( self ):
+        """
+        Hash of the whole position from scratch. makeMove/undoMove keep self.zobristKey up to date incrementally.
+        """
+        key = 0
+        for r in range(8):
+            for c in range(8):
+                if self.board[r][c] != "--":
+                    key ^= zobristPieceKeys[self.board[r][c]][r*8 + c]
+        if not self.whiteToMove:
+            key ^= zobristBlackToMoveKey
+        if self.enpassantPossible != ():
+            key ^= zobristEnpassantKeys[self.enpassantPossible[1]]
+        return key
+
+    def zobristMoveDelta( self, move, placedPiece, enpassantBefore, enpassantAfter ):
+        """
+        XOR of every key a move toggles. Applying it twice gives back the original key, so undo uses it as well.
+        """
+        delta = zobristPieceKeys[move.pieceMoved][move.startRow*8 + move.startCol]
+        delta ^= zobristPieceKeys[placedPiece][move.endRow*8 + move.endCol]
+        if move.pieceCaptured != "--":
+            captureRow = move.startRow if move.isEnpassantMove else move.endRow
+            delta ^= zobristPieceKeys[move.pieceCaptured][captureRow*8 + move.endCol]
+        if enpassantBefore != ():
+            delta ^= zobristEnpassantKeys[enpassantBefore[1]]
+        if enpassantAfter != ():
+            delta ^= zobristEnpassantKeys[enpassantAfter[1]]
+        return delta ^ zobristBlackToMoveKey
 
     def makeMove( self, move ):
         self.board[move.startRow][move.startCol] = "--"
@@ -57,10 +293,39 @@ class GameState():
             self.enpassantPossible = ((move.startRow + move.endRow)//2, move.startCol)
         else:
             self.enpassantPossible = ( )
+        self.enpassantPossibleLog.append(self.enpassantPossible)
+        self.zobristKey ^= self.zobristMoveDelta(move, self.board[move.endRow][move.endCol],
+                                                 self.enpassantPossibleLog[-2], self.enpassantPossible)
+        materialDelta, positionDelta = self.evaluationMoveDelta(move, self.board[move.endRow][move.endCol])
+        self.materialScore += materialDelta
+        self.positionScore += positionDelta
+        if move.pieceCaptured != "--":
+            self.pieceCount -= 1
+        #draw bookkeeping: fifty-move clock and how often each position has been reached
+        if move.pieceMoved[1] == 'p' or move.pieceCaptured != "--":
+            self.halfmoveClock = 0
+        else:
+            self.halfmoveClock += 1
+        self.halfmoveClockLog.append(self.halfmoveClock)
+        self.positionCounts[self.zobristKey] = self.positionCounts.get(self.zobristKey, 0) + 1
   
     def undoMove( self ):
         if len(self.movelog) != 0:                                          # make sure that there is a move to undo
             move = self.movelog.pop()
+            count = self.positionCounts[self.zobristKey]
+            if count == 1:
+                del self.positionCounts[self.zobristKey]
+            else:
+                self.positionCounts[self.zobristKey] = count - 1
+            self.halfmoveClockLog.pop()
+            self.halfmoveClock = self.halfmoveClockLog[-1]
+            self.zobristKey ^= self.zobristMoveDelta(move, self.board[move.endRow][move.endCol],
+                                                     self.enpassantPossibleLog[-2], self.enpassantPossibleLog[-1])
+            materialDelta, positionDelta = self.evaluationMoveDelta(move, self.board[move.endRow][move.endCol])
+            self.materialScore -= materialDelta
+            self.positionScore -= positionDelta
+            if move.pieceCaptured != "--":
+                self.pieceCount += 1
             self.board[move.startRow][move.startCol] = move.pieceMoved      # put piece on starting square
             self.board[move.endRow][move.endCol] = move.pieceCaptured       # put back captured piece
             self.whiteToMove = not self.whiteToMove                         # swap players
@@ -73,17 +338,59 @@ class GameState():
             if move.isEnpassantMove:
                 self.board[move.endRow] [move.endCol] = '--' #leave landing square blank
                 self.board[move.startRow] [move.endCol] = move.pieceCaptured
-                self.enpassantPossible = (move.endRow, move.endCol)
-            #undo a 2 square pawn advance
-            if move.pieceMoved[1] == 'p' and abs(move.startRow-move.endRow) == 2:
-                self.enpassantPossible = ()
+            #restore the en passant square of the previous position
+            self.enpassantPossibleLog.pop()
+            self.enpassantPossible = self.enpassantPossibleLog[-1]
             self.checkmate = False
             self.stalemate = False
         """
         All moves with considering checks.
         """
 
-    def getValidMoves(self):
+    def makeNullMove( self ):
+        """
+        Passes the turn without moving a piece, for null-move pruning in the search. Any en passant right lapses
+        as it would after a real move. Must not be used while in check. undoNullMove takes it back.
+        Positions after a pass are not counted in positionCounts since they cannot occur in a game.
+        """
+        if self.enpassantPossible != ():
+            self.zobristKey ^= zobristEnpassantKeys[self.enpassantPossible[1]]
+        self.zobristKey ^= zobristBlackToMoveKey
+        self.whiteToMove = not self.whiteToMove
+        self.enpassantPossible = ()
+        self.enpassantPossibleLog.append(self.enpassantPossible)
+
+    def undoNullMove( self ):
+        self.enpassantPossibleLog.pop()
+        self.enpassantPossible = self.enpassantPossibleLog[-1]
+        if self.enpassantPossible != ():
+            self.zobristKey ^= zobristEnpassantKeys[self.enpassantPossible[1]]
+        self.zobristKey ^= zobristBlackToMoveKey
+        self.whiteToMove = not self.whiteToMove
+        self.checkmate = False
+        self.stalemate = False
+
+    def isRepetition( self ):
+        """
+        True if the current position was already on the board earlier in the game line (same zobristKey).
+        """
+        return self.positionCounts.get(self.zobristKey, 0) > 1
+
+    def isThreefoldRepetition( self ):
+        return self.positionCounts.get(self.zobristKey, 0) >= 3
+
+    def isFiftyMoveDraw( self ):
+        """
+        True once 50 moves by each side went by without a capture or pawn move (checkmate still comes first).
+        """
+        return self.halfmoveClock >= 100
+
+    def getValidMoves(self, capturesOnly=False):
+        """
+        All moves with considering checks.
+        With capturesOnly (for quiescence search) only captures and promotions are generated, unless the side
+        to move is in check, where all evasions are returned. Stalemate is only detected for full generation.
+        """
         tempEnpassantPossible = self.enpassantPossible
         moves = []
         self.inCheck, self.pins, self.checks = self.checkForPinsAndChecks()
@@ -96,41 +403,16 @@ class GameState():
             kingCol = self.blackKingLocation[1]
             
         if self.inCheck:
-            if len(self.checks) == 1:  # Only 1 check, block check or move king
-                moves = self.getAllPossibleMoves()
-
-                # To block a check, you must move a piece into one of the squares between the enemy piece and king
-
-                check = self.checks[0]  # Check information
-                checkRow = check[0]
-                checkCol = check[1]
-                pieceChecking = self.board[checkRow][checkCol]  # Enemy piece causing the check
-                validSquares = []  # Squares that pieces can move to
-                
-                # If knight, must capture knight or move king; other pieces can be blocked
-                if pieceChecking[1] == 'N':
-                    validSquares = [(checkRow, checkCol)]
-                else:
-                    for i in range(1, 8):
-                        validSquare = (kingRow + check[2] * i, kingCol + check[3] * i)  # check[2], [3] are check direction
-                        validSquares.append(validSquare)
-                        if validSquare[0] == checkRow and validSquare[1] == checkCol:  # Once you get to piece, end checks
-                            break
-                
-                # Get rid of any moves that don't block check or capture piece
-                for i in range(len(moves) - 1, -1, -1):  # Go through backwards when removing from a list while iterating
-                    if moves[i].pieceMoved[1] != 'K':  # Move doesn't move king, so it must block or capture
-                        if (moves[i].endRow, moves[i].endCol) not in validSquares:  # Move doesn't block check or capture piece
-                            moves.pop(i)  # Use pop to remove element at index i
-    
+            if len(self.checks) == 1:  # Only 1 check, block check, capture the checker or move king
+                self.getCheckEvasions(kingRow, kingCol, self.checks[0], moves)
             else:  # Double check, king has to move
                 self.getKingMoves(kingRow, kingCol, moves)
         else:  # Not in check, so all moves are fine
-            moves = self.getAllPossibleMoves()
+            moves = self.getAllPossibleMoves(capturesOnly)
         if(len(moves) == 0):
             if self.inCheck:
                 self.checkmate = True
-            else:
+            elif not capturesOnly:
                 self.stalemate = True
         else:
             self.checkmate = False
@@ -139,7 +421,173 @@ class GameState():
 
 
     
-    def getAllPossibleMoves( self ):
+    def getCheckEvasions( self, kingRow, kingCol, check, moves ):
+        """
+        Legal moves out of a single check: king moves, captures of the checking piece and moves onto the squares
+        between it and the king. Instead of generating every move and filtering, each of those target squares is
+        looked at from the other side: which pawn, knight or slider of the side to move can reach it.
+        Pinned pieces are skipped, a pinned piece can never block or capture a checker.
+        """
+        checkRow, checkCol = check[0], check[1]
+        allyColor = "w" if self.whiteToMove else "b"
+        pawnDir = -1 if self.whiteToMove else 1
+        startRow = 6 if self.whiteToMove else 1
+        pinned = {(pin[0], pin[1]) for pin in self.pins}
+
+        targets = [(checkRow, checkCol)]                                    # knights and pawns can only be captured
+        if self.board[checkRow][checkCol][1] not in ('N', 'p'):
+            for i in range(1, 8):
+                square = (kingRow + check[2] * i, kingCol + check[3] * i)
+                if square == (checkRow, checkCol):
+                    break
+                targets.append(square)
+
+        knightMoves = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+        directions = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))
+        for endRow, endCol in targets:
+            # pawns: pushes onto an empty square, captures onto the checker
+            r = endRow - pawnDir
+            if self.board[endRow][endCol] == "--":
+                if 0 <= r < 8:
+                    if self.board[r][endCol] == allyColor + 'p':
+                        if (r, endCol) not in pinned:
+                            moves.append(Move((r, endCol), (endRow, endCol), self.board))
+                    elif self.board[r][endCol] == "--" and r - pawnDir == startRow and \
+                            self.board[startRow][endCol] == allyColor + 'p' and (startRow, endCol) not in pinned:
+                        moves.append(Move((startRow, endCol), (endRow, endCol), self.board))
+                if (endRow, endCol) == self.enpassantPossible:                  # en passant landing on the check line
+                    self.getEnpassantEvasions(endRow, endCol, pinned, moves)
+            elif 0 <= r < 8:
+                for dc in (-1, 1):
+                    if 0 <= endCol + dc < 8 and self.board[r][endCol + dc] == allyColor + 'p' and (r, endCol + dc) not in pinned:
+                        moves.append(Move((r, endCol + dc), (endRow, endCol), self.board))
+            # knights
+            for m in knightMoves:
+                r = endRow + m[0]
+                c = endCol + m[1]
+                if 0 <= r < 8 and 0 <= c < 8 and self.board[r][c] == allyColor + 'N' and (r, c) not in pinned:
+                    moves.append(Move((r, c), (endRow, endCol), self.board))
+            # sliders: the first piece seen from the target square in each direction
+            for j in range(8):
+                d = directions[j]
+                r = endRow + d[0]
+                c = endCol + d[1]
+                while 0 <= r < 8 and 0 <= c < 8:
+                    piece = self.board[r][c]
+                    if piece != "--":
+                        if piece[0] == allyColor and (piece[1] == 'Q' or piece[1] == ('R' if j < 4 else 'B')) and \
+                                (r, c) not in pinned:
+                            moves.append(Move((r, c), (endRow, endCol), self.board))
+                        break
+                    r += d[0]
+                    c += d[1]
+
+        if self.board[checkRow][checkCol][1] == 'p' and self.enpassantPossible == (checkRow + pawnDir, checkCol):
+            self.getEnpassantEvasions(checkRow + pawnDir, checkCol, pinned, moves)  # the checking pawn just moved two squares
+        self.getKingMoves(kingRow, kingCol, moves)
+
+    def getEnpassantEvasions( self, endRow, endCol, pinned, moves ):
+        """
+        En passant captures onto (endRow, endCol) by pawns that are not pinned.
+        """
+        r = endRow + (1 if self.whiteToMove else -1)
+        allyPawn = "wp" if self.whiteToMove else "bp"
+        for dc in (-1, 1):
+            c = endCol + dc
+            if 0 <= c < 8 and self.board[r][c] == allyPawn and (r, c) not in pinned and not self.enpassantExposesKing(r, c, endCol):
+                moves.append(Move((r, c), (endRow, endCol), self.board, isEnpassantMove=True))
+
+    def pickMoves( self, hashMoveID=None, killers=(), history=None ):
+        """
+        Staged move generation for the search. Returns a generator of the legal moves in the order: the hash move,
+        captures and promotions (captureOrderScore), the killer moves, the other quiet moves (highest history[moveID]
+        first). Each stage is only generated once the previous one is used up, so a cutoff early on saves the rest.
+        In check the evasions (few) are generated at once and handed out in the same order.
+        Checks and pins are worked out before returning, so self.inCheck is current; checkmate or stalemate is set
+        when the generator runs out without yielding a move.
+        """
+        self.inCheck, self.pins, self.checks = self.checkForPinsAndChecks()
+        self.checkmate = False
+        self.stalemate = False
+        return self.stagedMoves(tuple(self.pins), self.checks, hashMoveID, killers, history)
+
+    def stagedMoves( self, pins, checks, hashMoveID, killers, history ):
+        """
+        The generator behind pickMoves. The search makes and undoes moves between two yields, which leaves
+        self.pins to the last position generated, so each stage starts from a copy of this position's pins.
+        """
+        if len(checks) != 0:
+            kingRow, kingCol = self.whiteKingLocation if self.whiteToMove else self.blackKingLocation
+            evasions = []
+            self.pins = list(pins)
+            if len(checks) == 1:
+                self.getCheckEvasions(kingRow, kingCol, checks[0], evasions)
+            else:
+                self.getKingMoves(kingRow, kingCol, evasions)
+            if len(evasions) == 0:
+                self.checkmate = True
+                return
+            def evasionOrder(move):
+                if move.moveID == hashMoveID:
+                    return 3, 0
+                if move.pieceCaptured != "--" or move.isPawnPromotion:
+                    return 2, captureOrderScore(move)
+                if move.moveID in killers:
+                    return 1, -killers.index(move.moveID)
+                return 0, history[move.moveID] if history is not None else 0
+            evasions.sort(key=evasionOrder, reverse=True)
+            yield from evasions
+            return
+
+        searched = set()                                                    # moveIDs already handed out
+        if hashMoveID is not None:
+            move = self.findPieceMove(hashMoveID, pins)
+            if move is not None:
+                searched.add(move.moveID)
+                yield move
+
+        self.pins = list(pins)
+        captures = self.getAllPossibleMoves(capturesOnly=True)
+        captures.sort(key=captureOrderScore, reverse=True)
+        for move in captures:
+            if move.moveID not in searched:
+                searched.add(move.moveID)
+                yield move
+
+        for killerID in killers:                                            # captures are all searched by now
+            if killerID is not None and killerID not in searched:
+                move = self.findPieceMove(killerID, pins)
+                if move is not None:
+                    searched.add(killerID)
+                    yield move
+
+        self.pins = list(pins)
+        quiets = [move for move in self.getAllPossibleMoves() if move.moveID not in searched]
+        if len(quiets) == 0 and len(searched) == 0:
+            self.stalemate = True
+            return
+        if history is not None:
+            quiets.sort(key=lambda move: history[move.moveID], reverse=True)
+        yield from quiets
+
+    def findPieceMove( self, moveID, pins ):
+        """
+        The legal move with this moveID (a hash or killer move from another position), or None.
+        Only the moves of the piece on its start square are generated to find it.
+        """
+        startRow, startCol = divmod(moveID // 64, 8)
+        piece = self.board[startRow][startCol]
+        if piece[0] != ("w" if self.whiteToMove else "b"):
+            return None
+        self.pins = list(pins)
+        moves = []
+        self.moveFunctions[piece[1]](startRow, startCol, moves)
+        for move in moves:
+            if move.moveID == moveID:
+                return move
+        return None
+
+    def getAllPossibleMoves( self, capturesOnly=False ):
         """
         All moves without considering checks.
         """
@@ -149,14 +597,14 @@ class GameState():
                 turn = self.board[r][c][0]
                 if ( turn == "w" and self.whiteToMove ) or ( turn == "b" and not self.whiteToMove ):     
                     piece = self.board[r][c][1]
-                    self.moveFunctions[piece]( r, c, moves )                                           #Calls move funtion according to the piece type
+                    self.moveFunctions[piece]( r, c, moves, capturesOnly )                             #Calls move funtion according to the piece type
         return moves
 
 
 
 
 
-    def getPawnMoves( self, r, c, moves ):
+    def getPawnMoves( self, r, c, moves, capturesOnly=False ):
         """
         Get all the pawn moves for the pawn located at row, col and add the moves to the list.
         """
@@ -169,52 +617,52 @@ class GameState():
                 self.pins.remove(self.pins[i])
                 break
 
-        if self.whiteToMove:                                                # White pwan moves 
-            if self.board[r-1][c] == "--":                                  # 1 Square pawn advance
-                if not piecePinned or pinDirection == (-1,0):
-                    moves.append( Move( (r, c), (r-1,c), self.board ) )
-                    if r==6 and  self.board[r-2][c] == "--":                    # 2 Square pawn advance
-                        moves.append( Move( (r,c), (r-2,c), self.board ) )
-
-            if c-1 >= 0:                                                    # Capture Left
-                if self.board[r-1][c-1][0] == "b":                          # Enemy piece to capture
-                    if not piecePinned or pinDirection == (-1,-1):
-                        moves.append( Move( (r,c), (r-1,c-1), self.board ) )
-                elif (r-1, c-1) == self.enpassantPossible:
-                    moves.append(Move((r, c), (r-1, c-1), self.board, isEnpassantMove=True))
-
-            if c+1 <= 7:                                                    # Capture Right
-                if self.board[r-1][c+1][0] == "b" :                         # Enemy piece to capture
-                    if not piecePinned or pinDirection == (-1,1):
-                        moves.append( Move( (r,c), (r-1,c+1), self.board ) )
-                elif (r-1, c+1) == self.enpassantPossible:
-                    moves.append(Move((r, c), (r-1, c+1), self.board, isEnpassantMove=True))
-        else:                                                               #black pawn moves
-            if self.board[r + 1][c] == "--":                                # 1 square move
-                if not piecePinned or pinDirection == (1,0):
-                    moves.append(Move((r, c), (r + 1, c), self.board))
-                    if r == 1 and self.board[r + 2][c] == "--":                 # 2 square moves
-                        moves.append(Move((r, c), (r + 2, c), self.board))
-            # captures
-            
-            if c - 1 >= 0:                                                  # capture to left
-                if self.board[r + 1][c - 1][0] == 'w':
-                    if not piecePinned or pinDirection == (1,-1):
-                        moves.append(Move((r, c), (r + 1, c - 1), self.board))
-                elif (r + 1, c - 1) == self.enpassantPossible:
-                    moves.append(Move((r, c), (r + 1, c - 1), self.board, isEnpassantMove=True))
-            if c + 1 <= 7:                                                  # capture to right
-                if not piecePinned or pinDirection == (1,1):
-                    if self.board[r + 1][c + 1][0] == 'w':
-                        moves.append(Move((r, c), (r + 1, c + 1), self.board))
-                elif (r + 1, c + 1) == self.enpassantPossible:
-                    moves.append(Move((r, c), (r + 1, c + 1), self.board, isEnpassantMove=True))
-
+        if self.whiteToMove:                                                # White pawn moves
+            moveAmount = -1
+            startRow = 6
+            enemyColor = "b"
+        else:                                                               # Black pawn moves
+            moveAmount = 1
+            startRow = 1
+            enemyColor = "w"
+
+        promotionRow = 0 if self.whiteToMove else 7
+        if self.board[r+moveAmount][c] == "--" and (not capturesOnly or r+moveAmount == promotionRow):    # 1 Square pawn advance
+            if not piecePinned or pinDirection in ((moveAmount,0), (-moveAmount,0)):
+                moves.append( Move( (r, c), (r+moveAmount,c), self.board ) )
+                if r == startRow and self.board[r+2*moveAmount][c] == "--":   # 2 Square pawn advance
+                    moves.append( Move( (r,c), (r+2*moveAmount,c), self.board ) )
+
+        for dc in (-1, 1):                                                  # Capture Left, Capture Right
+            if 0 <= c+dc <= 7:
+                if not piecePinned or pinDirection in ((moveAmount,dc), (-moveAmount,-dc)):
+                    if self.board[r+moveAmount][c+dc][0] == enemyColor:     # Enemy piece to capture
+                        moves.append( Move( (r,c), (r+moveAmount,c+dc), self.board ) )
+                    elif (r+moveAmount, c+dc) == self.enpassantPossible and not self.enpassantExposesKing(r, c, c+dc):
+                        moves.append(Move((r, c), (r+moveAmount, c+dc), self.board, isEnpassantMove=True))
+
+    def enpassantExposesKing( self, r, c, captureCol ):
+        """
+        En passant removes two pawns from the same rank at once, which can open that rank
+        to an enemy rook or queen even though neither pawn was pinned on its own.
+        """
+        kingRow, kingCol = self.whiteKingLocation if self.whiteToMove else self.blackKingLocation
+        if kingRow != r:
+            return False
+        enemyColor = "b" if self.whiteToMove else "w"
+        step = 1 if captureCol > kingCol else -1
+        for col in range(kingCol + step, 8 if step == 1 else -1, step):
+            if col == c or col == captureCol:                               # both pawns leave the rank
+                continue
+            piece = self.board[r][col]
+            if piece != "--":
+                return piece[0] == enemyColor and piece[1] in ('R', 'Q')
+        return False
 
     """
     Get all the rook moves for the ROOKS located at row, col and add the moves to the list.
     """
-    def getRookMoves (self, r, c, moves):
+    def getRookMoves (self, r, c, moves, capturesOnly=False):
 
         piecePinned = False
         pinDirection = ()
@@ -237,7 +685,8 @@ class GameState():
                     if not piecePinned or pinDirection == d or pinDirection == (-d[0],-d[1]):
                         endPiece = self.board [endRow][endCol]
                         if endPiece == "--":                                                # empty space valid
-                            moves.append(Move((r, c), (endRow, endCol), self.board))
+                            if not capturesOnly:
+                                moves.append(Move((r, c), (endRow, endCol), self.board))
                         elif endPiece[0] == enemyColor:                                     # enemy piece valid
                             moves.append(Move((r, c), (endRow, endCol), self.board))
                             break
@@ -249,14 +698,14 @@ class GameState():
     """
         Get all the queen moves for the QUEEN located at row, col and add the moves to the list.
     """
-    def getQueenMoves (self, r, c, moves):
-        self.getRookMoves (r, c, moves) 
-        self.getBishopMoves (r, c, moves)
+    def getQueenMoves (self, r, c, moves, capturesOnly=False):
+        self.getRookMoves (r, c, moves, capturesOnly) 
+        self.getBishopMoves (r, c, moves, capturesOnly)
 
     """
         Get all the knight moves for the KNIGHTS located at row, col and add the moves to the list.
     """
-    def getKnightMoves (self, r, c, moves):
+    def getKnightMoves (self, r, c, moves, capturesOnly=False):
 
         piecePinned = False
         pinDirection = ()
@@ -277,13 +726,13 @@ class GameState():
             if 0 <= endRow < 8 and 0 <= endCol < 8:
                 if not piecePinned:
                     endPiece = self.board [endRow][endCol]
-                    if endPiece[0] != allyColor:                                           #not an ally piece (empty or enemy piece)
+                    if endPiece[0] != allyColor and (not capturesOnly or endPiece != "--"):   #not an ally piece (empty or enemy piece)
                         moves.append(Move((r, c), (endRow, endCol), self.board))
     """
         Get all the bishop moves for the BISHOP located at row, col and add the moves to the list.
     """
 
-    def getBishopMoves (self, r, c, moves):
+    def getBishopMoves (self, r, c, moves, capturesOnly=False):
 
 
         piecePinned = False
@@ -306,7 +755,8 @@ class GameState():
                     if not piecePinned or pinDirection == d or pinDirection == (-d[0], -d[1]):
                         endPiece = self.board [endRow][endCol]
                         if endPiece == "--":                                               # empty space valid I
-                            moves.append(Move((r, c), (endRow, endCol), self.board))
+                            if not capturesOnly:
+                                moves.append(Move((r, c), (endRow, endCol), self.board))
                         elif endPiece[0] == enemyColor:                                    # enemy piece valid
                             moves.append(Move((r, c), (endRow, endCol), self.board))
                             break
@@ -317,32 +767,73 @@ class GameState():
     """
         Get all the king moves for the KING located at row, col and add the moves to the list.
     """      
-    def getKingMoves (self, r, c, moves):
+    def getKingMoves (self, r, c, moves, capturesOnly=False):
 
         kingMoves = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
         allyColor = "w" if self.whiteToMove else "b"
+        enemyColor = "b" if self.whiteToMove else "w"
+        attacked = None
         for i in range(8):
             endRow = r + kingMoves[i][0]
             endCol = c + kingMoves[i][1]
             if 0 <= endRow <8 and 0 <= endCol < 8:
                 endPiece = self.board[endRow][endCol]
-                if endPiece[0] != allyColor:                                                # not an ally piece (empty or enemy piece)
-                    # place king on end square check for checks
-                    if allyColor == 'w':
-                        self.whiteKingLocation = (endRow, endCol)
-                    else:
-                        self.blackKingLocation = (endRow,endCol)
-                    
-                    inCheck , pins, checks =self.checkForPinsAndChecks()
-
-                    if not inCheck:
+                if endPiece[0] != allyColor and (not capturesOnly or endPiece != "--"):    # not an ally piece (empty or enemy piece)
+                    if attacked is None:                                                    # built once, only if the king has somewhere to go
+                        attacked = self.getAttackedSquares(enemyColor)
+                    if (endRow, endCol) not in attacked:
                         moves.append(Move((r, c), (endRow, endCol), self.board))
-                    #place king on original location
-                    if allyColor == 'w':
-                        self.whiteKingLocation = (r,c)
-                    else:
-                        self.blackKingLocation = (r,c)
 
+    """
+        Set of (row, col) squares attacked by the pieces of color.
+        The other side's king does not block sliders, so the squares behind it on a checking line count as attacked
+        and the king cannot step back along that line. Squares with pieces on them are included, so a piece that
+        is defended shows up as attacked too.
+    """
+    def getAttackedSquares (self, color):
+        attacked = set()
+        enemyKing = ("b" if color == "w" else "w") + "K"
+        pawnRow = -1 if color == "w" else 1
+        knightMoves = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+        kingMoves = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
+        rookDirections = ((-1, 0), (0, -1), (1, 0), (0, 1))
+        bishopDirections = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+        for r in range(8):
+            for c in range(8):
+                piece = self.board[r][c]
+                if piece[0] != color:
+                    continue
+                pieceType = piece[1]
+                if pieceType == "p":
+                    jumps = ((pawnRow, -1), (pawnRow, 1))
+                elif pieceType == "N":
+                    jumps = knightMoves
+                elif pieceType == "K":
+                    jumps = kingMoves
+                else:
+                    jumps = ()
+                    if pieceType == "R":
+                        directions = rookDirections
+                    elif pieceType == "B":
+                        directions = bishopDirections
+                    else:
+                        directions = rookDirections + bishopDirections
+                    for d in directions:
+                        endRow = r + d[0]
+                        endCol = c + d[1]
+                        while 0 <= endRow < 8 and 0 <= endCol < 8:
+                            attacked.add((endRow, endCol))
+                            endPiece = self.board[endRow][endCol]
+                            if endPiece != "--" and endPiece != enemyKing:                  # blocked
+                                break
+                            endRow += d[0]
+                            endCol += d[1]
+                for m in jumps:
+                    endRow = r + m[0]
+                    endCol = c + m[1]
+                    if 0 <= endRow < 8 and 0 <= endCol < 8:
+                        attacked.add((endRow, endCol))
+        return attacked
 
     """
         Returns if a player in check, a list of pins, and a list of checks
@@ -365,7 +856,7 @@ class GameState():
         
         # check outward from king for pins and checks, keep track of pins
 
-        directions = ((-1,0), (0,-1), (1,0), (0,1), (-1,-1), (1,1), (1,-1), (-1,1))
+        directions = ((-1,0), (0,-1), (1,0), (0,1), (-1,-1), (-1,1), (1,-1), (1,1))
 
         for j in range( len(directions) ):
             d = directions[j]
@@ -390,7 +881,7 @@ class GameState():
                             4) any direction and the piece is queen
                             5) any direction away and the piece is king (neccessary to avoid a king to move to a square controlled by another king)
                         """
-                        if ( 0<= j < 3 and type == 'R' ) or (4 <= j and j<=7 and type == 'B') or ( i==1 and type == 'p' and (( enemyColor == 'w' and 6<=j<=7 ) or (enemyColor == 'b' and 4 <= j <= 5))) or ( type == 'Q' ) or ( i==1 and type == 'K'):
+                        if ( 0<= j <= 3 and type == 'R' ) or (4 <= j and j<=7 and type == 'B') or ( i==1 and type == 'p' and (( enemyColor == 'w' and 6<=j<=7 ) or (enemyColor == 'b' and 4 <= j <= 5))) or ( type == 'Q' ) or ( i==1 and type == 'K'):
                             if possiblePin == ():                                           # no piece blocking, so check
                                 inCheck = True
                                 checks.append((endRow,endCol,d[0],d[1]))
@@ -421,6 +912,13 @@ class GameState():
 
 
 class Move():
+    """
+      A move is created for every pseudo-legal destination during search, so it is kept small: fixed __slots__
+      instead of a per-object __dict__, and moveID packs the from and to squares into one int
+      (from * 64 + to, squares numbered row * 8 + col). The search stores and compares moveIDs only.
+    """
+    __slots__ = ("startRow", "startCol", "endRow", "endCol", "pieceMoved", "pieceCaptured",
+                 "isPawnPromotion", "isEnpassantMove", "moveID")
     #maps keys to values
     #key value
     ranksToRows = {"1": 7, "2": 6, "3": 5, "4": 4,
@@ -431,25 +929,24 @@ class Move():
     colsToFiles = {v: k for k, v in filesToCols.items()}
     
     def __init__( self, startSq, endSq, board, isEnpassantMove=False ):
-        self.startRow = startSq[0]
-        self.startCol = startSq[1]
-        self.endRow = endSq[0]
-        self.endCol = endSq[1]
-        self.pieceMoved = board[self.startRow][self.startCol]
-        self.pieceCaptured = board[self.endRow][self.endCol]
-        self.isPawnPromotion = False
-        if (self.pieceMoved == 'wp' and self.endRow == 0) or (self.pieceMoved == 'bp' and self.endRow == 7):
-            self.isPawnPromotion = True
-        self.isEnpassantMove = False
+        self.startRow = startRow = startSq[0]
+        self.startCol = startCol = startSq[1]
+        self.endRow = endRow = endSq[0]
+        self.endCol = endCol = endSq[1]
+        self.pieceMoved = pieceMoved = board[startRow][startCol]
         #pawn promotion
-        self.isPawnPromotion = (self.pieceMoved == 'wp' and self.endRow == 0) or (self.pieceMoved == 'bp' and self.endRow == 7)
+        self.isPawnPromotion = (pieceMoved == 'wp' and endRow == 0) or (pieceMoved == 'bp' and endRow == 7)
         #en passant
         self.isEnpassantMove = isEnpassantMove
-        if self.isEnpassantMove:
-            self.pieceCaptured = 'wp' if self.pieceMoved == 'bp' else 'bp'
-        self.moveID = self.startRow * 1000 + self.startCol * 100 + self.endRow * 10 + self.endCol 
-        #print(self.moveID)
-    
+        if isEnpassantMove:
+            self.pieceCaptured = 'wp' if pieceMoved == 'bp' else 'bp'
+        else:
+            self.pieceCaptured = board[endRow][endCol]
+        self.moveID = (startRow * 8 + startCol) * 64 + endRow * 8 + endCol
+
+    def __hash__( self ):
+        return self.moveID
+
     def __eq__( self, other ):
         """
         Overriding the equals method.
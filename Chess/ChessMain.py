@@ -1,28 +1,46 @@
 """
   This is our main driver file. It will be responsible for handling user input and displaying the current GameState object
 """
-#import os
+import os
 
 import pygame as p 
 import ChessEngine 
 import SmartMoveFinder
+from multiprocessing import Process, Queue
+import queue
 
 WIDTH = HEIGHT = 512 
 DIMENSION = 8                                                                   #dimensions of a chess board are 8x8
 SQ_SIZE = HEIGHT // DIMENSION
 MAX_FPS = 15                                                                     #For animations later on
+LOG_SEARCH_STATS = False                                                        #print the AI's search statistics after each move
 IMAGES = {}
+PIECES = ["wR","wp","wB","wQ","wK","wN","bp","bR","bB","bQ","bK","bN"]
+IMAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "images")
+ATLAS_PATH = os.path.join(IMAGE_DIR, "atlas_%d.png" % SQ_SIZE)              #all pieces pre-scaled side by side, built on first run
 
 """
-  Initialize a global dictionary of images. This will be called exactly once in the main
+  Initialize a global dictionary of images. Called the first time the board is drawn.
+  The pieces come from one sprite atlas already scaled to SQ_SIZE; it is rebuilt from the single piece PNGs
+  when missing or older than them.
 """
 
 def loadImages():
-
-  pieces=["wR","wp","wB","wQ","wK","wN","bp","bR","bB","bQ","bK","bN"]
-  for piece in pieces:
-    s =   "chess" + "/" + "images/" + piece + ".png"
-    IMAGES[ piece ] = p.transform.scale( p.image.load(s), ( SQ_SIZE, SQ_SIZE ) )
+  sources = [os.path.join(IMAGE_DIR, piece + ".png") for piece in PIECES]
+  if os.path.exists(ATLAS_PATH) and os.path.getmtime(ATLAS_PATH) >= max(os.path.getmtime(s) for s in sources):
+    atlas = p.image.load(ATLAS_PATH)
+  else:
+    atlas = p.Surface((SQ_SIZE * len(PIECES), SQ_SIZE), p.SRCALPHA)
+    for i, s in enumerate(sources):
+      atlas.blit(p.transform.scale( p.image.load(s), ( SQ_SIZE, SQ_SIZE ) ), (i * SQ_SIZE, 0))
+    try:
+      p.image.save(atlas, ATLAS_PATH)
+    except (OSError, p.error):                                                  #read-only install, build it again next time
+      pass
+  if p.display.get_surface() is not None:
+    atlas = atlas.convert_alpha()                                               #display pixel format, faster blits
+  for i, piece in enumerate(PIECES):
+    IMAGES[ piece ] = atlas.subsurface(p.Rect(i * SQ_SIZE, 0, SQ_SIZE, SQ_SIZE))
 
 #Note: we can access an image by saying 'IMAGES
 ''' 
@@ -30,28 +48,34 @@ def loadImages():
 '''
 
 def main():
-
   p.init()
   screen = p.display.set_mode( ( WIDTH, HEIGHT ) )
   clock = p.time.Clock()
   screen.fill( p.Color( "white" ) )
+  renderer = BoardRenderer(screen)
   gs = ChessEngine.GameState()
   ValidMoves = gs.getValidMoves()
   moveMade = False                                #flag variable for when a move is made
   animate = False #flag for when we should we animate a move
-  loadImages()                                    #only do this once, before the while loop
   running = True
   sqSelected = ()                                 #no square is selected, keep track of the last click of the user (tuple: (row, col))
   playerClicks = []                               #keep track of player clicks (two tuples: [(6, 4), (4, 4)]) moving pwan 2 steps.
   gameOver = False
   playerOne = True
   playerTwo = False
+  AIThinking = False                              #True while a background process searches for the AI move
+  moveFinderProcess = None
+  returnQueue = None
+  searchKey = None                                #(zobristKey, moves played) of the position the AI is searching
   while running:
     humanTurn = (gs.whiteToMove and playerOne) or (not gs.whiteToMove and playerTwo)
     for e in p.event.get():
 
       if e.type == p.QUIT:
-        runnning = False
+        running = False
+
+      elif e.type == p.VIDEOEXPOSE:                  #window contents were lost, draw everything again
+        renderer.invalidate()
       
       #this is for moving the chess pieces.(by clicking the mouse)
       elif e.type == p.MOUSEBUTTONDOWN :
@@ -85,125 +109,227 @@ def main():
       # key handler
       elif e.type == p.KEYDOWN:                    
             if e.key == p.K_z:                     # undo when 'z' is pressed		                   
+                if AIThinking:                     # the search is for a position that no longer exists
+                    cancelSearch(moveFinderProcess)
+                    AIThinking = False
                 gs.undoMove()
-                moveMade = True
+                ValidMoves = gs.getValidMoves()
                 animate = False
                 gameOver=False
-            if e.key == p.K_z:                     # reset the enitre game(board) when 'r' is pressed		                   
+            if e.key == p.K_r:                     # reset the enitre game(board) when 'r' is pressed		                   
+                if AIThinking:
+                    cancelSearch(moveFinderProcess)
+                    AIThinking = False
                 gs = ChessEngine.GameState()
                 ValidMoves = gs.getValidMoves()
-                sqSelected = {}
+                sqSelected = ()
                 playerClicks = []
                 moveMade = False
                 animate = False
                 gameOver=False
-      #AI move finder
-      if not gameOver and not humanTurn:
-         AIMove = SmartMoveFinder.findBestMove(gs,ValidMoves)
-         if AIMove is None: 
-            AIMove = SmartMoveFinder.findRandomMove(ValidMoves)
-         gs.makeMove(AIMove)
-         moveMade = True
-         animate = True
-
-      if moveMade:
-         if animate:
-            animateMove(gs.movelog[-1], screen, gs.board, clock)
-         ValidMoves=gs.getValidMoves()
-         moveMade=False
-         animate = False
-
-    drawGameState( screen, gs, ValidMoves, sqSelected)
+            humanTurn = (gs.whiteToMove and playerOne) or (not gs.whiteToMove and playerTwo)
+
+    #AI move finder
+    if AIThinking and (gameOver or humanTurn or searchKey != (gs.zobristKey, len(gs.movelog))):
+       cancelSearch(moveFinderProcess)             #the search is for a position that is no longer on the board, drop its result
+       AIThinking = False
+    if not gameOver and not humanTurn:
+       if not AIThinking:                           #start searching in the background, the window keeps drawing meanwhile
+          AIThinking = True
+          searchKey = (gs.zobristKey, len(gs.movelog))
+          returnQueue = Queue()
+          moveFinderProcess = Process(target=SmartMoveFinder.findBestMoveToQueue, args=(gs, ValidMoves, returnQueue))
+          moveFinderProcess.start()
+       try:
+          AIMove, searchStats = returnQueue.get_nowait()        #poll, never block the UI loop
+       except queue.Empty:
+          pass
+       else:
+          moveFinderProcess.join()
+          if LOG_SEARCH_STATS:
+             print(searchStats)
+          AIThinking = False
+          if AIMove is None: 
+             AIMove = SmartMoveFinder.findRandomMove(ValidMoves)
+          gs.makeMove(AIMove)
+          moveMade = True
+          animate = True
+
+    if moveMade:
+       if animate:
+          renderer.animateMove(gs.movelog[-1], gs.board, clock)
+       ValidMoves=gs.getValidMoves()
+       moveMade=False
+       animate = False
+
+    overlayKeys = []
+    if AIThinking:
+       overlayKeys.append("thinking")
     if gs.checkmate:
        gameOver = True
        if gs.whiteToMove:
-          drawText(screen, 'Black wins by checkmate')
+          overlayKeys.append('Black wins by checkmate')
        else:
-          drawText(screen, 'White wins by checkmate')
+          overlayKeys.append('White wins by checkmate')
     elif gs.stalemate:
        gameOver = True
-       drawText(screen, 'Stalemate')      
+       overlayKeys.append('Stalemate')
+    dirtyRects = renderer.render(gs.board, getHighlights(gs, ValidMoves, sqSelected), overlayKeys)
     clock.tick( MAX_FPS )
-    p.display.flip()
+    if dirtyRects:
+       p.display.update(dirtyRects)
+  if AIThinking:
+    cancelSearch(moveFinderProcess)
+  p.quit()
 
+'''
+  Stops an in-flight AI search, its result is no longer wanted
+'''
+
+def cancelSearch(moveFinderProcess):
+  if moveFinderProcess is not None and moveFinderProcess.is_alive():
+    moveFinderProcess.terminate()
+  moveFinderProcess.join()
+
+
+BOARD_COLORS = [p.Color("white"), p.Color("#B6A09F")]            #light, dark squares
+fonts = {}                                                          #size -> font, SysFont is slow to create
+
+def getFont(size):
+  if size not in fonts:
+    fonts[size] = p.font.SysFont("Helvitca", size, True, False)
+  return fonts[size]
+
+'''
+  Draws the game with dirty rectangles. The empty board is rendered once; every frame only the squares whose
+  piece or highlight changed since they were last drawn (and the text overlays) are redrawn, and only those
+  rectangles are sent to the display.
+'''
+
+class BoardRenderer():
+  def __init__(self, screen):
+    self.screen = screen
+    if not IMAGES:
+      loadImages()
+    self.boardSurface = p.Surface((WIDTH, HEIGHT))
+    drawBoard(self.boardSurface)
+    self.highlightSurfaces = {}
+    for highlight, color in (("selected", "blue"), ("target", "yellow")):
+      s = p.Surface((SQ_SIZE, SQ_SIZE))
+      s.set_alpha(100) #transperancy value -> transparent; 255 opaque
+      s.fill(p.Color(color))
+      self.highlightSurfaces[highlight] = s
+    self.invalidate()
+
+  def invalidate(self):
+    #forget what is on screen, the next render redraws everything (e.g. after the window was covered)
+    self.shownSquares = {}  #(row, col) -> (piece, highlight) as last drawn
+    self.shownOverlays = [] #overlay keys as last drawn
+    self.overlayRects = []
+
+  def drawSquare(self, r, c, piece, highlight):
+    square = p.Rect(c*SQ_SIZE, r*SQ_SIZE, SQ_SIZE, SQ_SIZE)
+    self.screen.blit(self.boardSurface, square, square)
+    if highlight is not None:
+      self.screen.blit(self.highlightSurfaces[highlight], square)
+    if piece != "--":
+      self.screen.blit(IMAGES[piece], square)
+    self.shownSquares[(r, c)] = (piece, highlight)
+    return square
+
+  def render(self, board, highlights, overlays):
+    """
+    Brings the screen up to date with board, highlights ({(row, col): "selected"/"target"}) and overlays
+    (keys for getOverlay). Returns the rectangles that changed, for p.display.update.
+    """
+    dirty = []
+    overlayBlits = [blit for key in overlays for blit in getOverlay(key)]
+    overlayRects = [rect for surface, rect in overlayBlits]
+    overlaysChanged = overlays != self.shownOverlays
+    uncovered = self.overlayRects if overlaysChanged else [] #squares under overlays that went away or moved
+    for r in range(DIMENSION):
+      for c in range(DIMENSION):
+        state = (board[r][c], highlights.get((r, c)))
+        square = p.Rect(c*SQ_SIZE, r*SQ_SIZE, SQ_SIZE, SQ_SIZE)
+        if self.shownSquares.get((r, c)) != state or square.collidelist(uncovered) != -1:
+          dirty.append(self.drawSquare(r, c, state[0], state[1]))
+    if overlaysChanged or any(rect.collidelist(dirty) != -1 for rect in overlayRects):
+      for surface, rect in overlayBlits:
+        self.screen.blit(surface, rect)
+      dirty.extend(overlayRects)
+    self.shownOverlays = list(overlays)
+    self.overlayRects = overlayRects
+    return dirty
+
+  def animateMove(self, move, board, clock):
+    """
+    Slides the moved piece from its start to its end square. Only the rectangles the piece leaves and enters are
+    redrawn each frame, from a copy of the board without the moving piece.
+    """
+    before = [row[:] for row in board] #the position being left, minus the moving piece
+    before[move.endRow][move.endCol] = "--" if move.isEnpassantMove else move.pieceCaptured
+    if move.isEnpassantMove:
+      before[move.startRow][move.endCol] = move.pieceCaptured
+    p.display.update(self.render(before, {}, []))
+    background = self.screen.copy()
+    dR = move.endRow - move.startRow
+    dC = move.endCol - move.startCol
+    framesPerSquare = 10 #frames to move one square
+    frameCount = (abs (dR) +abs(dC)) * framesPerSquare
+    previous = None
+    for frame in range(frameCount + 1):
+      r, c = (move.startRow + dR*frame/frameCount, move.startCol + dC*frame/frameCount)
+      pieceRect = p.Rect(c*SQ_SIZE, r*SQ_SIZE, SQ_SIZE, SQ_SIZE)
+      if previous is not None:
+        self.screen.blit(background, previous, previous)
+      self.screen.blit(IMAGES[move.pieceMoved], pieceRect)
+      p.display.update([pieceRect] if previous is None else [previous, pieceRect])
+      previous = pieceRect
+      clock.tick(60)
+    self.shownSquares.pop((move.endRow, move.endCol), None) #now shows the moving piece, redrawn by the next render
 
 # Highlight square selected and moves for piece selected
-def highlightSquares (screen, gs, validMoves, sqSelected):
+def getHighlights(gs, validMoves, sqSelected):
+   highlights = {}
    if sqSelected != ():
       r, c = sqSelected
       if gs.board[r][c][0] == ('w' if gs.whiteToMove else 'b'): #sqSelected is a piece that can be moved
-         #highlight selected square
-         s = p.Surface((SQ_SIZE, SQ_SIZE))
-         s.set_alpha(100) #transperancy value -> transparent; 255 opaque
-         s.fill(p.Color('blue'))
-         screen.blit(s, (c*SQ_SIZE, r*SQ_SIZE))
+         highlights[(r, c)] = "selected"
          #highlight moves from that square
-         s.fill(p.Color('yellow'))
          for move in validMoves:
             if move.startRow == r and move.startCol == c:
-               screen.blit(s, (move.endCol*SQ_SIZE, move.endRow*SQ_SIZE))
-
-''' 
-  Draw the squares on the board.
-'''
-
-def drawGameState( screen, gs , validMoves, sqSelected):
-  drawBoard( screen ) 				                        #To draw scores on board 
-  highlightSquares (screen, gs, validMoves, sqSelected)
-  drawPieces( screen, gs.board )	                    #draw peices on top of squares
+               highlights[(move.endRow, move.endCol)] = "target"
+   return highlights
 
 '''
   Draw the squares on the board
 '''
 
-def drawBoard( screen ):
-  global colors
-  colors = [p.Color("white"), p.Color("#B6A09F")]
+def drawBoard( surface ):
   for r in range(DIMENSION):
     for c in range(DIMENSION):
-      color = colors[ ( (r+c) % 2) ]
-      p.draw.rect( screen, color, p.Rect( c*SQ_SIZE, r*SQ_SIZE, SQ_SIZE, SQ_SIZE ) )
+      color = BOARD_COLORS[ ( (r+c) % 2) ]
+      p.draw.rect( surface, color, p.Rect( c*SQ_SIZE, r*SQ_SIZE, SQ_SIZE, SQ_SIZE ) )
 
 '''
-  Draw pieces on board using the current GameState.board
-''' 
+  Text drawn over the board: "thinking" or a game over message. Returns a list of (surface, rect) to blit.
+'''
 
-def drawPieces( screen, board ):
-  for r in range( DIMENSION ):
-    for c in range( DIMENSION ):
-      piece = board[r][c]
-      # If not empty square
-      if piece != "--": 
-        screen.blit( IMAGES[ piece ], p.Rect( c*SQ_SIZE, r*SQ_SIZE, SQ_SIZE, SQ_SIZE ) )
-
-def animateMove (move, screen, board, clock):
-   global colors
-   dR = move.endRow - move.startRow
-   dC = move.endCol - move.startCol
-   framesPerSquare = 10 #frames to move one square
-   frameCount = (abs (dR) +abs(dC)) * framesPerSquare
-   for frame in range(frameCount + 1):
-      r, c = (move.startRow + dR*frame/frameCount, move.startCol + dC*frame/frameCount)
-      drawBoard (screen)
-      drawPieces (screen, board)
-      #erase the piece moved from its ending square
-      color = colors [(move.endRow + move.endCol) % 2]
-      endSquare =  p. Rect(move.endCol*SQ_SIZE, move.endRow*SQ_SIZE, SQ_SIZE, SQ_SIZE)
-      p.draw.rect(screen, color, endSquare)
-      #draw captured piece onto rectangle
-      if move.pieceCaptured != '--':
-         screen.blit(IMAGES[move.pieceCaptured], endSquare)
-      #draw moving piece I
-      screen.blit(IMAGES[move.pieceMoved], p.Rect(c*SQ_SIZE, r*SQ_SIZE, SQ_SIZE, SQ_SIZE))
-      p.display.flip()
-      clock.tick(60)
-def drawText (screen, text):
-   font = p.font. SysFont("Helvitca", 32, True, False)
-   textObject = font.render(text, 0, p.Color('Gray'))
-   textLocation = p. Rect(0, 0, WIDTH, HEIGHT).move(WIDTH/2 - textObject.get_width()/2, HEIGHT/2 - textObject.get_height()/2)
-   screen.blit(textObject, textLocation)
-   textObject = font.render(text, 0, p.Color('Black'))
-   screen.blit(textObject, textLocation.move(2, 2))
+overlayCache = {}
+
+def getOverlay(key):
+   if key not in overlayCache:
+      if key == "thinking":
+         textObject = getFont(20).render("Thinking...", 0, p.Color('Black'))
+         overlayCache[key] = [(textObject, textObject.get_rect(topleft=(4, HEIGHT - textObject.get_height() - 4)))]
+      else:
+         font = getFont(32)
+         shadow = font.render(key, 0, p.Color('Gray'))
+         textLocation = p. Rect(0, 0, WIDTH, HEIGHT).move(WIDTH/2 - shadow.get_width()/2, HEIGHT/2 - shadow.get_height()/2)
+         textObject = font.render(key, 0, p.Color('Black'))
+         overlayCache[key] = [(shadow, shadow.get_rect(topleft=textLocation.topleft)),
+                          (textObject, textObject.get_rect(topleft=textLocation.move(2, 2).topleft))]
+   return overlayCache[key]
 
 if __name__== "__main__":
   main()
@@ -0,0 +1,146 @@
+"""
+  EPD test suites: positions with "bm" (best move) / "am" (avoid move) operations, solved with findBestMove under
+  a per-position budget. Positions are read one line at a time, so suites of any size run in constant memory.
+
+  python Epd.py suite.epd --depth 3
+  python Epd.py suite.epd --time 1.0 --processes 8 --limit 1000
+"""
+
+import argparse
+import itertools
+import re
+import sys
+import time
+from multiprocessing import Pool
+
+import ChessEngine
+import Pgn
+import SmartMoveFinder
+
+_operationPattern = re.compile(r'\s*(\w+)(?:\s+("[^"]*"|[^;]*))?;')
+
+
+def parseEpd(line):
+    """
+    (fen, operations) for an EPD line, where operations maps an opcode to its list of operands
+    (strings unquoted). The halfmove clock and move number come from "hmvc"/"fmvn" when present.
+    """
+    fields = line.split(None, 4)
+    if len(fields) < 4:
+        raise ValueError("bad EPD line: " + line)
+    operations = {}
+    for opcode, operands in _operationPattern.findall(fields[4] if len(fields) > 4 else ""):
+        operands = operands.strip()
+        operations[opcode] = [operands[1:-1]] if operands.startswith('"') else operands.split()
+    halfmoveClock = operations.get("hmvc", ["0"])[0]
+    moveNumber = operations.get("fmvn", ["1"])[0]
+    return " ".join(fields[:4] + [halfmoveClock, moveNumber]), operations
+
+
+def readEpd(path):
+    """
+    Yields (fen, operations) for every position of an EPD file, lazily.
+    """
+    with open(path) as epdFile:
+        for line in epdFile:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                yield parseEpd(line)
+
+
+def solvePosition(task):
+    """
+    Searches one position. Returns a dict with the move played, whether it solves the position (None if the
+    expected moves cannot be read, e.g. castling), nodes and seconds.
+    """
+    fen, operations, maxDepth, timeLimit, nodeLimit = task
+    gs = ChessEngine.GameState(fen)
+    validMoves = gs.getValidMoves()
+    best = [Pgn.parseSan(gs, san, validMoves) for san in operations.get("bm", [])]
+    avoid = [Pgn.parseSan(gs, san, validMoves) for san in operations.get("am", [])]
+    SmartMoveFinder.transpositionTable.clear()
+    start = time.perf_counter()
+    move, stats = SmartMoveFinder.findBestMoveWithStats(gs, validMoves, maxDepth, timeLimit, nodeLimit)
+    seconds = time.perf_counter() - start
+    if None in best or None in avoid or (not best and not avoid) or move is None:
+        solved = None
+    else:
+        solved = (not best or move in best) and move not in avoid
+    return {"id": operations.get("id", [""])[0], "fen": fen,
+            "move": Pgn.moveToSan(gs, move, validMoves) if move is not None else None,
+            "expected": " ".join(operations.get("bm", [])) or "not " + " ".join(operations.get("am", [])),
+            "solved": solved, "nodes": stats.nodes, "seconds": seconds}
+
+
+def setupWorker(nullMove=True, lateMoveReductions=True):
+    SmartMoveFinder.setOpeningBook(None)                            # suites test the search, not the book
+    SmartMoveFinder.useNullMove = nullMove
+    SmartMoveFinder.useLateMoveReductions = lateMoveReductions
+
+
+def runSuite(path, maxDepth=None, timeLimit=None, nodeLimit=None, processes=1, limit=None, verbose=True,
+             nullMove=True, lateMoveReductions=True):
+    """
+    Solves the positions of an EPD file and prints the totals. Returns (solved, tried, skipped).
+    With processes > 1 positions are searched in parallel, a bounded batch at a time so the file is never read ahead.
+    nullMove and lateMoveReductions switch those search features, to measure what they gain.
+    """
+    tasks = ((fen, operations, maxDepth, timeLimit, nodeLimit)
+             for fen, operations in itertools.islice(readEpd(path), limit))
+    solved = tried = skipped = 0
+    totalNodes = 0
+    totalSeconds = 0.0
+    pool = Pool(processes, initializer=setupWorker, initargs=(nullMove, lateMoveReductions)) if processes > 1 else None
+    if pool is None:
+        setupWorker(nullMove, lateMoveReductions)
+    try:
+        while True:
+            batch = list(itertools.islice(tasks, max(processes, 1) * 4))
+            if len(batch) == 0:
+                break
+            results = pool.imap(solvePosition, batch) if pool is not None else map(solvePosition, batch)
+            for result in results:
+                totalNodes += result["nodes"]
+                totalSeconds += result["seconds"]
+                if result["solved"] is None:
+                    skipped += 1
+                    status = "skipped"
+                else:
+                    tried += 1
+                    solved += result["solved"]
+                    status = "ok" if result["solved"] else "FAIL"
+                if verbose:
+                    print("%-20s %-8s expected %-12s played %-8s %9d nodes %7.2fs"
+                          % (result["id"][:20], status, result["expected"], result["move"], result["nodes"],
+                             result["seconds"]))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    print("solved %d of %d (%.1f%%), %d skipped" % (solved, tried, 100.0 * solved / tried if tried else 0.0, skipped))
+    if totalSeconds > 0:
+        print("%d nodes in %.2fs, %.0f nps" % (totalNodes, totalSeconds, totalNodes / totalSeconds))
+    return solved, tried, skipped
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run an EPD test suite")
+    parser.add_argument("epd", help="EPD file with bm/am operations")
+    parser.add_argument("--depth", type=int, help="search depth per position")
+    parser.add_argument("--time", type=float, help="seconds per position")
+    parser.add_argument("--nodes", type=int, help="nodes per position")
+    parser.add_argument("--processes", type=int, default=1, help="positions searched at once")
+    parser.add_argument("--limit", type=int, help="only the first positions of the file")
+    parser.add_argument("--quiet", action="store_true", help="only print the totals")
+    parser.add_argument("--no-null-move", action="store_true", help="search without null-move pruning")
+    parser.add_argument("--no-lmr", action="store_true", help="search without late move reductions")
+    args = parser.parse_args(argv)
+
+    runSuite(args.epd, args.depth, args.time, args.nodes, args.processes, args.limit, not args.quiet,
+             not args.no_null_move, not args.no_lmr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,151 @@
+"""
+  Opening book stored as a binary file of fixed 16 byte records sorted by position key, laid out like a
+  Polyglot book: big-endian (key: uint64, move: uint16, weight: uint16, learn: uint32).
+  key is GameState.zobristKey and move is Move.moveID, so only books built by this module match our positions.
+
+  The file is memory mapped and searched with a binary search, so a lookup touches a handful of pages and
+  the book costs no memory beyond them.
+
+  python OpeningBook.py build book.bin games.pgn [more.pgn ...] [--plies 20] [--min-count 2]
+  python OpeningBook.py probe book.bin [--fen "<fen>"]
+"""
+
+import mmap
+import random
+import struct
+import sys
+
+import ChessEngine
+import Pgn
+
+RECORD = struct.Struct(">QHHI")
+KEY = struct.Struct(">Q")
+
+
+class OpeningBook():
+    def __init__( self, path ):
+        self.bookFile = open(path, "rb")
+        size = self.bookFile.seek(0, 2)
+        self.entries = size // RECORD.size
+        self.data = mmap.mmap(self.bookFile.fileno(), 0, access=mmap.ACCESS_READ) if size > 0 else b""
+
+    def close( self ):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.bookFile.close()
+
+    def keyAt( self, index ):
+        return KEY.unpack_from(self.data, index * RECORD.size)[0]
+
+    def findEntries( self, key ):
+        """
+        List of (moveID, weight) stored for a position key.
+        """
+        low, high = 0, self.entries
+        while low < high:                                           # first record with a key >= key
+            middle = (low + high) // 2
+            if self.keyAt(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        entries = []
+        index = low
+        while index < self.entries:
+            recordKey, moveID, weight, learn = RECORD.unpack_from(self.data, index * RECORD.size)
+            if recordKey != key:
+                break
+            entries.append((moveID, weight))
+            index += 1
+        return entries
+
+    def getMove( self, gs, validMoves, pickBest=False ):
+        """
+        A book move for the position, chosen at random in proportion to its weight (or the heaviest one with
+        pickBest), or None if the position is not in the book.
+        """
+        movesByID = {move.moveID: move for move in validMoves}
+        choices = [(movesByID[moveID], weight) for moveID, weight in self.findEntries(gs.zobristKey)
+                   if moveID in movesByID and weight > 0]
+        if len(choices) == 0:
+            return None
+        if pickBest:
+            return max(choices, key=lambda choice: choice[1])[0]
+        return random.choices([move for move, weight in choices], [weight for move, weight in choices])[0]
+
+
+def resultWeight(result, whiteMoved):
+    """
+    Polyglot style scoring: 2 for a move by the side that went on to win, 1 for a draw, 0 for a loss.
+    """
+    if result == "1/2-1/2":
+        return 1
+    if (result == "1-0" and whiteMoved) or (result == "0-1" and not whiteMoved):
+        return 2
+    if result in ("1-0", "0-1"):
+        return 0
+    return 1
+
+
+def buildBook(pgnPaths, bookPath, maxPlies=20, minCount=1):
+    """
+    Replays the first maxPlies moves of every game in the PGN files and writes a book of the moves played
+    at least minCount times. A game stops counting at the first move the engine cannot play (e.g. castling).
+    Returns the number of records written.
+    """
+    counts = {}                                                     # (key, moveID) -> [times played, score]
+    for path in pgnPaths:
+        for headers, sanMoves in Pgn.readGames(path):
+            result = headers.get("Result", "*")
+            gs = ChessEngine.GameState()
+            if "FEN" in headers:
+                gs.loadFen(headers["FEN"])
+            for san in sanMoves[:maxPlies]:
+                move = Pgn.parseSan(gs, san)
+                if move is None:
+                    break
+                stats = counts.setdefault((gs.zobristKey, move.moveID), [0, 0])
+                stats[0] += 1
+                stats[1] += resultWeight(result, gs.whiteToMove)
+                gs.makeMove(move)
+
+    records = [(key, moveID, min(stats[1], 0xFFFF)) for (key, moveID), stats in counts.items() if stats[0] >= minCount]
+    records.sort(key=lambda record: (record[0], -record[2], record[1]))
+    with open(bookPath, "wb") as bookFile:
+        for key, moveID, weight in records:
+            bookFile.write(RECORD.pack(key, moveID, weight, 0))
+    return len(records)
+
+
+def main(argv=None):
+    import argparse                                                 # here: the engine imports this module, the CLI is rare
+    parser = argparse.ArgumentParser(description="Build or query an opening book")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="build a book from PGN files")
+    build.add_argument("book")
+    build.add_argument("pgn", nargs="+")
+    build.add_argument("--plies", type=int, default=20, help="only the first moves of each game")
+    build.add_argument("--min-count", type=int, default=1, help="leave out moves played fewer times")
+    probe = commands.add_parser("probe", help="list the book moves of a position")
+    probe.add_argument("book")
+    probe.add_argument("--fen", help="position to look up (default: the starting position)")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        written = buildBook(args.pgn, args.book, args.plies, args.min_count)
+        print("%d book entries written to %s" % (written, args.book))
+        return 0
+
+    gs = ChessEngine.GameState()
+    if args.fen:
+        gs.loadFen(args.fen)
+    book = OpeningBook(args.book)
+    movesByID = {move.moveID: move for move in gs.getValidMoves()}
+    for moveID, weight in book.findEntries(gs.zobristKey):
+        if moveID in movesByID:
+            print("%s %d" % (movesByID[moveID].getChessNotation(), weight))
+    book.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
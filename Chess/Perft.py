@@ -0,0 +1,148 @@
+"""
+  Perft: counts the leaf nodes of the legal move tree to a fixed depth.
+  Known node counts for standard positions tell us whether move generation is still legal after a change,
+  and nodes per second is the throughput baseline for getValidMoves + makeMove/undoMove.
+
+  python Perft.py                      run the standard suite
+  python Perft.py --depth 4 --divide   per root move breakdown, for finding where a count goes wrong
+  python Perft.py --fen "<fen>" --depth 3 --divide --processes 8
+"""
+
+import argparse
+import sys
+import time
+from multiprocessing import Pool
+
+import ChessEngine
+import BitboardEngine
+
+STARTPOS = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w - - 0 1"
+
+"""
+  (name, fen, {depth: nodes}). Only positions and depths where castling and under-promotion
+  (which the engine does not play) cannot occur, so the published counts apply as they are.
+"""
+POSITIONS = [
+    ("start position", STARTPOS, {1: 20, 2: 400, 3: 8902, 4: 197281, 5: 4865609}),
+    ("rook and pawns endgame", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     {1: 14, 2: 191, 3: 2812, 4: 43238, 5: 674624}),
+    ("castled middlegame", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     {1: 46, 2: 2079, 3: 89890, 4: 3894594}),
+    ("double check", "8/8/2k5/5q2/5n2/8/5K2/8 b - - 0 1", {4: 23527}),
+]
+
+
+def newGameState(fen, bitboard=False):
+    gs = BitboardEngine.BitboardGameState() if bitboard else ChessEngine.GameState()
+    gs.loadFen(fen)
+    return gs
+
+
+def perft(gs, depth):
+    """
+    Leaf nodes at depth. The last ply is counted from the move list without making the moves.
+    """
+    moves = gs.getValidMoves()
+    if depth <= 1:
+        return len(moves) if depth == 1 else 1
+    nodes = 0
+    for move in moves:
+        gs.makeMove(move)
+        nodes += perft(gs, depth - 1)
+        gs.undoMove()
+    return nodes
+
+
+def perftAfterMove(args):
+    """
+    Pool worker: plays one root move and counts the tree below it.
+    """
+    gs, move, depth = args
+    gs.makeMove(move)
+    try:
+        return perft(gs, depth - 1)
+    finally:
+        gs.undoMove()                                               # tasks of one pool chunk share a pickled gs
+
+
+def divide(gs, depth, processes=1):
+    """
+    List of (move, nodes) for every root move. With processes > 1 the root moves are split across a process pool.
+    """
+    moves = gs.getValidMoves()
+    if processes > 1:
+        with Pool(processes) as pool:
+            counts = pool.map(perftAfterMove, [(gs, move, depth) for move in moves])
+    else:
+        counts = [perftAfterMove((gs, move, depth)) for move in moves]
+    return list(zip(moves, counts))
+
+
+def runPerft(gs, depth, showDivide=False, processes=1):
+    """
+    Counts nodes to depth and prints the divide table when asked. Returns (nodes, seconds).
+    """
+    start = time.perf_counter()
+    if showDivide or processes > 1:
+        results = divide(gs, depth, processes)
+        nodes = sum(count for move, count in results)
+    else:
+        results = []
+        nodes = perft(gs, depth)
+    seconds = time.perf_counter() - start
+    if showDivide:
+        for move, count in sorted(results, key=lambda result: result[0].getChessNotation()):
+            print("  %s: %d" % (move.getChessNotation(), count))
+    return nodes, seconds
+
+
+def report(name, depth, nodes, seconds, expected=None):
+    nps = nodes / seconds if seconds > 0 else 0.0
+    if expected is None:
+        status = ""
+    elif nodes == expected:
+        status = "ok"
+    else:
+        status = "FAIL (expected %d)" % expected
+    print("%-28s depth %d  nodes %10d  %8.2fs  %10.0f nps  %s" % (name, depth, nodes, seconds, nps, status))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Perft node counts and move generation speed")
+    parser.add_argument("--fen", help="search this position instead of the standard suite")
+    parser.add_argument("--depth", type=int, help="only this depth (default: every depth with a known count up to 3)")
+    parser.add_argument("--divide", action="store_true", help="print node counts per root move")
+    parser.add_argument("--processes", type=int, default=1, help="split root moves across this many processes")
+    parser.add_argument("--bitboard", action="store_true", help="use BitboardEngine instead of ChessEngine")
+    args = parser.parse_args(argv)
+
+    if args.fen:
+        positions = [("position", args.fen, {})]
+    else:
+        positions = POSITIONS
+    failures = 0
+    totalNodes = 0
+    totalSeconds = 0.0
+    for name, fen, expectedCounts in positions:
+        if args.depth is not None:
+            depths = [args.depth]
+        elif expectedCounts:
+            depths = [depth for depth in sorted(expectedCounts) if depth <= 3] or [min(expectedCounts)]
+        else:
+            depths = [3]
+        for depth in depths:
+            gs = newGameState(fen, args.bitboard)
+            nodes, seconds = runPerft(gs, depth, args.divide, args.processes)
+            expected = expectedCounts.get(depth)
+            report(name, depth, nodes, seconds, expected)
+            if expected is not None and nodes != expected:
+                failures += 1
+            totalNodes += nodes
+            totalSeconds += seconds
+    if totalSeconds > 0:
+        print("total %d nodes in %.2fs, %.0f nps" % (totalNodes, totalSeconds, totalNodes / totalSeconds))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
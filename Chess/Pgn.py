@@ -0,0 +1,151 @@
+"""
+  Reading and writing PGN games and standard algebraic notation (SAN) moves.
+  Games are streamed one at a time so large collections never have to fit in memory.
+"""
+
+import re
+
+import ChessEngine
+
+RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+
+_headerPattern = re.compile(r'\[(\w+)\s+"(.*)"\]')
+_commentPattern = re.compile(r"\{[^}]*\}|;[^\n]*")
+_moveNumberPattern = re.compile(r"^\d+\.+")
+_sanPattern = re.compile(r"^([KQRBN])?([a-h])?([1-8])?(x)?([a-h][1-8])(=?[QRBN])?$")
+
+
+def readGames(path):
+    """
+    Yields (headers, sanMoves) for every game in a PGN file. Comments, variations and NAGs are dropped.
+    """
+    headers = {}
+    movetext = []
+    with open(path, encoding="utf-8", errors="replace") as pgnFile:
+        for line in pgnFile:
+            line = line.strip()
+            match = _headerPattern.match(line)
+            if match:
+                if movetext:                                        # a new game starts without a blank line
+                    yield headers, parseMovetext(" ".join(movetext))
+                    headers, movetext = {}, []
+                headers[match.group(1)] = match.group(2)
+            elif line:
+                movetext.append(line)
+                if line.split()[-1] in RESULTS:                     # result token ends the game
+                    yield headers, parseMovetext(" ".join(movetext))
+                    headers, movetext = {}, []
+    if movetext:
+        yield headers, parseMovetext(" ".join(movetext))
+
+
+def parseMovetext(text):
+    """
+    List of SAN moves of the main line.
+    """
+    text = _commentPattern.sub(" ", text)
+    while "(" in text:                                              # innermost variations first
+        text = re.sub(r"\([^()]*\)", " ", text)
+    moves = []
+    for token in text.split():
+        token = _moveNumberPattern.sub("", token)
+        if token == "" or token in RESULTS or token.startswith("$"):
+            continue
+        moves.append(token)
+    return moves
+
+
+def parseSan(gs, san, validMoves=None):
+    """
+    The Move in validMoves (the legal moves of gs when not given) matching a SAN string, or None if there is
+    no such move or the engine cannot play it (castling, under-promotion).
+    """
+    san = san.rstrip("+#!?")
+    match = _sanPattern.match(san)
+    if match is None:
+        return None
+    piece, fromFile, fromRank, capture, target, promotion = match.groups()
+    if promotion is not None and promotion[-1] != "Q":
+        return None
+    pieceType = piece if piece is not None else "p"
+    endRow = ChessEngine.Move.ranksToRows[target[1]]
+    endCol = ChessEngine.Move.filesToCols[target[0]]
+    if validMoves is None:
+        validMoves = gs.getValidMoves()
+    candidates = []
+    for move in validMoves:
+        if move.pieceMoved[1] != pieceType or move.endRow != endRow or move.endCol != endCol:
+            continue
+        if fromFile is not None and move.startCol != ChessEngine.Move.filesToCols[fromFile]:
+            continue
+        if fromRank is not None and move.startRow != ChessEngine.Move.ranksToRows[fromRank]:
+            continue
+        candidates.append(move)
+    return candidates[0] if len(candidates) == 1 else None
+
+
+def moveToSan(gs, move, validMoves=None):
+    """
+    SAN string of a legal move in the position of gs (validMoves are its legal moves, generated when not given),
+    with "+" or "#" when it gives check or mate.
+    """
+    if validMoves is None:
+        validMoves = gs.getValidMoves()
+    target = move.getRankFile(move.endRow, move.endCol)
+    if move.pieceMoved[1] == "p":
+        san = (move.getRankFile(move.startRow, move.startCol)[0] + "x" if move.pieceCaptured != "--" else "") + target
+        if move.isPawnPromotion:
+            san += "=Q"
+    else:
+        others = [other for other in validMoves if other.pieceMoved == move.pieceMoved and other.moveID != move.moveID
+                  and other.endRow == move.endRow and other.endCol == move.endCol]
+        disambiguation = ""
+        if others:
+            square = move.getRankFile(move.startRow, move.startCol)
+            if all(other.startCol != move.startCol for other in others):
+                disambiguation = square[0]
+            elif all(other.startRow != move.startRow for other in others):
+                disambiguation = square[1]
+            else:
+                disambiguation = square
+        san = move.pieceMoved[1] + disambiguation + ("x" if move.pieceCaptured != "--" else "") + target
+    flags = gs.inCheck, gs.checkmate, gs.stalemate
+    gs.makeMove(move)
+    gs.getValidMoves()
+    if gs.checkmate:
+        san += "#"
+    elif gs.inCheck:
+        san += "+"
+    gs.undoMove()
+    gs.inCheck, gs.checkmate, gs.stalemate = flags                  # getValidMoves above set them for the position after
+    return san
+
+
+def formatGame(headers, sanMoves, result, firstMoveNumber=1, whiteMovesFirst=True):
+    """
+    A game as PGN text: the header tags, then the movetext wrapped at 80 columns and ended by the result.
+    """
+    lines = ['[%s "%s"]' % (tag, str(value).replace('"', "'")) for tag, value in headers.items()]
+    tokens = []
+    moveNumber = firstMoveNumber
+    whiteMoves = whiteMovesFirst
+    for i, san in enumerate(sanMoves):
+        if whiteMoves:
+            tokens.append("%d." % moveNumber)
+        elif i == 0:
+            tokens.append("%d..." % moveNumber)
+        tokens.append(san)
+        if not whiteMoves:
+            moveNumber += 1
+        whiteMoves = not whiteMoves
+    tokens.append(result)
+    line = ""
+    movetext = []
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > 80:
+            movetext.append(line)
+            line = token
+        else:
+            line = line + " " + token if line else token
+    movetext.append(line)
+    return "\n".join(lines) + "\n\n" + "\n".join(movetext) + "\n"
@@ -1,10 +1,149 @@
+import os
 import random
+import time
+import ChessEngine
+import OpeningBook
+import Tablebase
 
-pieceScore = {"K":0 , "Q": 10 , "R" : 5 , "B" : 3 , "N" : 3, "p" : 1}
+pieceScore = ChessEngine.pieceScore
+POSITION_WEIGHT = 0.1 #piece-square tables are in tenths of a pawn
 
 CHECKMATE  = 1000
 STALEMATE  = 0
 DEPTH=2
+MAX_DEPTH = 64 #depth cap when the search is only limited by time or nodes
+OPENING_BOOK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "book.bin") #built with OpeningBook.py
+CHECK_INTERVAL = 1024 #nodes between clock checks
+useTablebases = True #probe the endgame tables (built with Tablebase.py) once 3 pieces or fewer are left
+useNullMove = True #null-move pruning, see findMoveNegaMaxAlphaBeta
+useLateMoveReductions = True
+
+NULL_MOVE_REDUCTION = 2 #the pass is searched this much shallower than a real move
+NULL_MOVE_MIN_DEPTH = 3
+NULL_MOVE_VERIFY_PIECES = 10 #with this few pieces left a null-move cutoff is verified by a real (reduced) search
+NULL_WINDOW = 0.01 #scores are multiples of 0.1, so this window only separates "below" from "at or above" a bound
+LMR_MIN_DEPTH = 3
+LMR_FULL_DEPTH_MOVES = 3 #moves searched at full depth before later quiet moves get reduced
+ASPIRATION_WINDOW = 0.5 #each iteration first searches this far either side of the previous score, in pawns
+
+#bound types stored in the transposition table
+EXACT = 0
+LOWERBOUND = 1 #search failed high, real score is at least this
+UPPERBOUND = 2 #search failed low, real score is at most this
+
+'''
+  Fixed size hash table of searched positions, indexed by the low bits of GameState.zobristKey.
+  Each slot holds (key, depth, score, bound, bestMoveID, generation). A slot is overwritten when the new
+  result is at least as deep, or when the stored one is left over from an earlier search.
+'''
+
+class TranspositionTable():
+  def __init__(self, sizeBits=18):
+    self.size = 1 << sizeBits
+    self.mask = self.size - 1
+    self.entries = [None] * self.size
+    self.generation = 0
+
+  def newSearch(self):
+    self.generation += 1
+
+  def clear(self):
+    self.entries = [None] * self.size
+
+  def probe(self, key):
+    entry = self.entries[key & self.mask]
+    if entry is not None and entry[0] == key:
+      return entry
+    return None
+
+  def store(self, key, depth, score, bound, bestMoveID):
+    index = key & self.mask
+    old = self.entries[index]
+    if old is None or old[0] == key or depth >= old[1] or old[5] != self.generation:
+      self.entries[index] = (key, depth, score, bound, bestMoveID, self.generation)
+
+transpositionTable = TranspositionTable()
+
+'''
+  What one search did, for tuning and for spotting performance regressions in logs.
+  nodes counts every node, quiescence nodes included (qnodes counts those alone). A high first move cutoff rate
+  means the move ordering puts the refutation first. iterations holds (depth, score, nodes, seconds) for every
+  completed iteration, nodes and seconds counted from the start of the search.
+  source is "search", "book" or "tablebase" depending on where the move came from.
+'''
+
+class SearchStats():
+  def __init__(self):
+    self.nodes = 0
+    self.qnodes = 0
+    self.betaCutoffs = 0
+    self.firstMoveCutoffs = 0
+    self.ttProbes = 0
+    self.ttHits = 0
+    self.nullMoveCutoffs = 0
+    self.reductions = 0
+    self.reSearches = 0 #reduced or null window searches that failed high and were repeated
+    self.aspirationReSearches = 0 #root searches repeated because the score fell outside the aspiration window
+    self.iterations = []
+    self.depth = 0
+    self.score = None
+    self.principalVariation = []
+    self.source = "search"
+    self.startTime = time.time()
+    self.seconds = 0.0
+
+  def add(self, other):
+    #counts of a search done elsewhere (a worker process) as part of this one
+    self.nodes += other.nodes
+    self.qnodes += other.qnodes
+    self.betaCutoffs += other.betaCutoffs
+    self.firstMoveCutoffs += other.firstMoveCutoffs
+    self.ttProbes += other.ttProbes
+    self.ttHits += other.ttHits
+    self.nullMoveCutoffs += other.nullMoveCutoffs
+    self.reductions += other.reductions
+    self.reSearches += other.reSearches
+    self.aspirationReSearches += other.aspirationReSearches
+
+  def firstMoveCutoffRate(self):
+    return self.firstMoveCutoffs / self.betaCutoffs if self.betaCutoffs else 0.0
+
+  def ttHitRate(self):
+    return self.ttHits / self.ttProbes if self.ttProbes else 0.0
+
+  def nps(self):
+    seconds = self.seconds if self.seconds > 0 else time.time() - self.startTime
+    return self.nodes / seconds if seconds > 0 else 0.0
+
+  def asDict(self):
+    return {"source": self.source, "depth": self.depth, "score": self.score, "nodes": self.nodes,
+            "qnodes": self.qnodes, "betaCutoffs": self.betaCutoffs, "firstMoveCutoffRate": self.firstMoveCutoffRate(),
+            "ttProbes": self.ttProbes, "ttHits": self.ttHits, "nullMoveCutoffs": self.nullMoveCutoffs,
+            "reductions": self.reductions, "reSearches": self.reSearches,
+            "aspirationReSearches": self.aspirationReSearches, "seconds": self.seconds, "nps": self.nps(),
+            "iterations": [{"depth": depth, "score": score, "nodes": nodes, "seconds": seconds}
+                           for depth, score, nodes, seconds in self.iterations],
+            "pv": [move.getChessNotation() for move in self.principalVariation]}
+
+  def __str__(self):
+    return ("depth %d nodes %d (%d quiescence) %.2fs %.0f nps, cutoffs %d (%.0f%% first move), tt hits %d/%d"
+            % (self.depth, self.nodes, self.qnodes, self.seconds, self.nps(), self.betaCutoffs,
+               100 * self.firstMoveCutoffRate(), self.ttHits, self.ttProbes))
+
+#state of the current search, reset by findBestMove
+nextMove = None
+searchStats = SearchStats() #statistics of the current (or last) search
+nodeCallback = None #called with searchStats every nodeCallbackInterval nodes
+nodeCallbackInterval = 10000
+searchDeadline = None
+searchNodeLimit = None
+searchAborted = False
+completedDepth = 0
+principalVariation = []
+stopRequested = False #set from another thread (e.g. Uci.py) to end the search; cleared by the caller, not by the search
+killerMoves = [] #per ply, the two most recent quiet moves (moveIDs) that caused a beta cutoff
+historyTable = [0] * 4096 #indexed by moveID
+pvTable = [] #triangular principal variation table, see findMoveNegaMaxAlphaBeta
 
 '''
   Picks and returns a random move
@@ -53,16 +192,408 @@ def findRandomMove(validMoves):
 #       gs.undoMove()
 #   return bestPlayerMove
 
-def findBestMove(gs, validMoves):
-     global nextMove, counter
-     nextMove = None
-     random.shuffle(validMoves)
-     counter = 0
-    #  findMoveMinMax(gs, validMoves, DEPTH, gs.whiteToMove)
-     findMoveNegaMax(gs, validMoves, DEPTH,1 if gs.whiteToMove else -1)
-     #findMoveNegaMaxAlphaBeta(gs, validMoves, DEPTH,-CHECKMATE, CHECKMATE, 1 if gs.whiteToMove else -1)
-     print(counter)
-     return nextMove
+'''
+  Iterative deepening: searches depth 1, 2, 3, ... until maxDepth is done or the time (seconds) or node budget
+  runs out, and returns the best move of the last iteration that finished. With no limits given it searches to DEPTH.
+  Each iteration's principal variation is searched first in the next one, inside an aspiration window of
+  ASPIRATION_WINDOW around its score that is widened (and the iteration repeated) when the score falls outside it.
+  With workers > 1 the root moves are split across that many processes (see findMoveParallel).
+  Positions in the opening book are answered from the book, and positions in the endgame tablebases from the
+  tables, without searching.
+  What the search did is left in searchStats (see findBestMoveWithStats). onIteration(searchStats), if given, is
+  called after every completed iteration, and onNodes(searchStats) every nodeInterval nodes.
+'''
+
+def findBestMove(gs, validMoves, maxDepth=None, timeLimit=None, nodeLimit=None, workers=1, onIteration=None,
+                 onNodes=None, nodeInterval=10000):
+     global nextMove, completedDepth, principalVariation, nodeCallback, nodeCallbackInterval
+     if maxDepth is None:
+       maxDepth = DEPTH if timeLimit is None and nodeLimit is None else MAX_DEPTH
+     resetSearch(maxDepth, None if timeLimit is None else time.time() + timeLimit, nodeLimit)
+     nodeCallback = onNodes
+     nodeCallbackInterval = nodeInterval
+     book = getOpeningBook()
+     if book is not None:
+       bookMove = book.getMove(gs, validMoves)
+       if bookMove is not None:
+         searchStats.source = "book"
+         return bookMove
+     if useTablebases and gs.pieceCount <= 3:
+       tablebaseMove = findTablebaseMove(gs, validMoves)
+       if tablebaseMove is not None:
+         searchStats.source = "tablebase"
+         return tablebaseMove
+     parallelSearch = startParallelSearch(gs, maxDepth, workers) if workers > 1 and len(validMoves) > 0 else None
+     bestMove = None
+     score = 0
+     for depth in range(1, maxDepth + 1):
+       alpha, beta = -CHECKMATE, CHECKMATE
+       if depth > 1 and abs(score) < CHECKMATE / 2:
+         alpha, beta = score - ASPIRATION_WINDOW, score + ASPIRATION_WINDOW
+       window = ASPIRATION_WINDOW
+       while True:
+         nextMove = None
+        #  findMoveMinMax(gs, validMoves, depth, gs.whiteToMove)
+        #  findMoveNegaMax(gs, validMoves, depth,1 if gs.whiteToMove else -1)
+         if parallelSearch is None:
+           score = findMoveNegaMaxAlphaBeta(gs, validMoves, depth, alpha, beta, 1 if gs.whiteToMove else -1)
+         else:
+           score = findMoveParallel(gs, validMoves, depth, alpha, beta, parallelSearch)
+         if searchAborted:
+           break
+         window *= 4
+         if score <= alpha and alpha > -CHECKMATE:
+           alpha = max(score - window, -CHECKMATE)
+         elif score >= beta and beta < CHECKMATE:
+           beta = min(score + window, CHECKMATE)
+         else:
+           break
+         searchStats.aspirationReSearches += 1
+       if searchAborted:
+         break
+       bestMove = nextMove
+       completedDepth = depth
+       principalVariation = getPrincipalVariation(gs, depth, pvTable[0])
+       recordIteration(depth, score, onIteration)
+       if abs(score) >= CHECKMATE: #forced mate found, deeper search cannot improve on it
+         break
+     searchStats.seconds = time.time() - searchStats.startTime
+     return bestMove
+
+'''
+  findBestMove that also returns its statistics: (move, SearchStats)
+'''
+
+def findBestMoveWithStats(gs, validMoves, *args, **kwargs):
+  move = findBestMove(gs, validMoves, *args, **kwargs)
+  return move, searchStats
+
+def recordIteration(depth, score, onIteration):
+  searchStats.iterations.append((depth, score, searchStats.nodes, time.time() - searchStats.startTime))
+  searchStats.depth = depth
+  searchStats.score = score
+  searchStats.principalVariation = principalVariation
+  if onIteration is not None:
+    onIteration(searchStats)
+
+'''
+  The opening book is opened on first use if OPENING_BOOK_PATH exists; setOpeningBook(None) turns it off
+'''
+
+openingBook = None
+openingBookLoaded = False
+
+def getOpeningBook():
+  global openingBook, openingBookLoaded
+  if not openingBookLoaded:
+    openingBookLoaded = True
+    if os.path.exists(OPENING_BOOK_PATH):
+      openingBook = OpeningBook.OpeningBook(OPENING_BOOK_PATH)
+  return openingBook
+
+def setOpeningBook(path):
+  global openingBook, openingBookLoaded
+  if openingBook is not None:
+    openingBook.close()
+  openingBook = OpeningBook.OpeningBook(path) if path is not None else None
+  openingBookLoaded = True
+
+'''
+  Tablebase results as search scores for the side to move: a win is CHECKMATE less the plies to mate, so shorter
+  mates score higher and a lost side prefers the longest defence. None if no table covers the position.
+'''
+
+def tablebaseScore(gs):
+  result = Tablebase.probe(gs)
+  if result is None:
+    return None
+  outcome, plies = result
+  if outcome == Tablebase.DRAW:
+    return STALEMATE
+  return outcome * (CHECKMATE - plies)
+
+def findTablebaseMove(gs, validMoves):
+  bestMove = None
+  bestScore = -CHECKMATE - 1
+  for move in validMoves:
+    gs.makeMove(move)
+    gs.getValidMoves()
+    score = tablebaseScore(gs)
+    gs.undoMove()
+    if score is None:
+      return None
+    if -score > bestScore:
+      bestScore = -score
+      bestMove = move
+  return bestMove
+
+'''
+  Clears the per-search state: statistics, limits, PV, killers and history
+'''
+
+def resetSearch(maxDepth, deadline, nodeLimit):
+  global principalVariation, completedDepth, killerMoves, historyTable, nodeCallback, pvTable
+  resetLimits(deadline, nodeLimit)
+  nodeCallback = None
+  principalVariation = []
+  completedDepth = 0
+  killerMoves = [[None, None] for ply in range(maxDepth + 1)]
+  pvTable = [[] for ply in range(maxDepth + 2)] #ply -> best line found from that ply of the current path
+  historyTable = [0] * 4096
+  transpositionTable.newSearch()
+
+'''
+  Fresh statistics and limits, for a new search or for another task of the same parallel search
+'''
+
+def resetLimits(deadline, nodeLimit):
+  global searchStats, searchDeadline, searchNodeLimit, searchAborted
+  searchStats = SearchStats()
+  searchDeadline = deadline
+  searchNodeLimit = nodeLimit
+  searchAborted = False
+
+'''
+  Root splitting: the root of every iteration (and of every aspiration re-search) is searched as in
+  findMoveNegaMaxAlphaBeta, with the root moves spread over worker processes. The first (best ordered) root move is
+  searched on its own to get a score to beat. Then every worker searches its other root moves one at a time with a
+  null window on the best score so far, which only proves a move is no better (late ones reduced as below the
+  root); a move that fails high is searched again at once by the same worker with the full window, and raises the
+  score every root move sent after it has to beat.
+  A root move is picked with the single process search's rule (the first in order with the best score), but the
+  score can still differ from it at equal depth: which bound each move is searched against depends on the order
+  the workers finish in, and null-move pruning, reductions and the transposition tables all depend on the window.
+  Each root move is always searched by the same worker, so the worker's transposition table holds that move's
+  tree from the previous iterations, as the single process table would. A worker keeps its table, killers and
+  history between the tasks of one search and clears them when the next search starts; every task gets the
+  previous iteration's principal variation to order its moves. A node limit is shared out between the tasks not
+  finished yet.
+'''
+
+workerConnections = [] #one pipe end per worker process, see runWorker
+workerProcesses = []
+parallelSearchCount = 0 #numbers the parallel searches, so workers know when a new one starts
+workerSearchNumber = None #in a worker: the search its tables belong to
+rootMoveWorkers = {} #moveID -> index of the worker that searches this root move in the current search
+
+def getWorkerPool(workers):
+  if len(workerConnections) != workers:
+    closeWorkerPool()
+    from multiprocessing import Pipe, Process #imported here: multiprocessing is most of this module's import time
+    for i in range(workers):
+      connection, workerConnection = Pipe()
+      process = Process(target=runWorker, args=(workerConnection,), daemon=True)
+      process.start()
+      workerConnections.append(connection)
+      workerProcesses.append(process)
+  return workerConnections
+
+def closeWorkerPool():
+  for process in workerProcesses:
+    process.terminate()
+    process.join()
+  del workerConnections[:]
+  del workerProcesses[:]
+
+'''
+  Worker process main loop: receives searchRootMove tasks and sends back their results, until None
+'''
+
+def runWorker(connection):
+  while True:
+    task = connection.recv()
+    if task is None:
+      break
+    connection.send(searchRootMove(task))
+
+'''
+  Sets up a parallel search: returns the worker connections and the settings every task carries
+'''
+
+def startParallelSearch(gs, maxDepth, workers):
+  global parallelSearchCount
+  connections = getWorkerPool(workers)
+  parallelSearchCount += 1
+  rootMoveWorkers.clear()
+  #the workers were forked (or spawned) with other values
+  settings = (useTablebases, useNullMove, useLateMoveReductions, maxDepth, parallelSearchCount,
+              gs.checkForPinsAndChecks()[0])
+  return connections, settings
+
+'''
+  findMoveNegaMaxAlphaBeta's root (ply 0) for a parallel search: returns the score and sets nextMove and
+  pvTable[0] the same way
+'''
+
+def findMoveParallel(gs, validMoves, depth, alpha, beta, parallelSearch):
+  global nextMove, searchAborted
+  from multiprocessing.connection import wait
+  connections, settings = parallelSearch
+  alphaOriginal = alpha
+  entry = transpositionTable.probe(gs.zobristKey)
+  orderMoves(validMoves, entry, 0)
+  root = (gs, validMoves, depth, completedDepth > 0, settings)
+  queues = {connection: [] for connection in connections} #root moves (by number) each worker has left to search
+  for moveNumber, move in enumerate(validMoves):
+    worker = rootMoveWorkers.setdefault(move.moveID, len(rootMoveWorkers) % len(connections))
+    queues[connections[worker]].append(moveNumber)
+  running = {} #connection -> (move number, alpha, beta, node budget) of the task it searches
+  firstConnection = connections[rootMoveWorkers[validMoves[0].moveID]]
+  queues[firstConnection].pop(0)
+  sendRootTask(firstConnection, running, queues, root, 0, alpha, beta)
+  maxScore, aborted, line = receiveRootTask(firstConnection, running)
+  bestMove = validMoves[0]
+  bestMoveNumber = 0
+  alpha = max(alpha, maxScore)
+  while True:
+    if not aborted and alpha < beta:
+      for connection in connections:
+        if connection not in running and len(queues[connection]) > 0:
+          moveNumber = queues[connection].pop(0)
+          window = alpha - NULL_WINDOW if moveNumber < bestMoveNumber else alpha #a tie with an earlier move wins
+          sendRootTask(connection, running, queues, root, moveNumber, window, window + NULL_WINDOW)
+    if len(running) == 0:
+      break
+    connection = wait(list(running))[0]
+    moveNumber, taskAlpha, taskBeta, budget = running[connection]
+    score, moveAborted, moveLine = receiveRootTask(connection, running)
+    aborted = aborted or moveAborted
+    if aborted or alpha >= beta or score <= taskAlpha:
+      continue #only collecting the tasks still running, or no better than the best move
+    if taskBeta != beta: #failed high on a null window, may be better than the best move: get its exact score
+      searchStats.reSearches += 1
+      window = alpha - NULL_WINDOW if moveNumber < bestMoveNumber else alpha
+      sendRootTask(connection, running, queues, root, moveNumber, window, beta)
+    elif score > maxScore or (score == maxScore and moveNumber < bestMoveNumber):
+      maxScore = score
+      bestMove = validMoves[moveNumber]
+      bestMoveNumber = moveNumber
+      line = moveLine
+      alpha = max(alpha, maxScore)
+      if alpha >= beta:
+        searchStats.betaCutoffs += 1
+  if aborted or (searchNodeLimit is not None and searchStats.nodes >= searchNodeLimit and completedDepth > 0):
+    searchAborted = True
+    return 0
+  nextMove = bestMove
+  pvTable[0] = [bestMove] + line if maxScore > alphaOriginal else []
+  if maxScore <= alphaOriginal:
+    bound = UPPERBOUND
+  elif maxScore >= beta:
+    bound = LOWERBOUND
+  else:
+    bound = EXACT
+  transpositionTable.store(gs.zobristKey, depth, maxScore, bound, bestMove.moveID)
+  return maxScore
+
+'''
+  Starts a searchRootMove task on a worker: root move moveNumber with the window (alpha, beta). With a node limit
+  the task's budget is an even share of what is not yet used or promised to the running tasks, counting the root
+  moves still queued.
+'''
+
+def sendRootTask(connection, running, queues, root, moveNumber, alpha, beta):
+  gs, validMoves, depth, mayAbort, settings = root
+  budget = None
+  if searchNodeLimit is not None:
+    promised = sum(task[3] for task in running.values())
+    tasksLeft = 1 + sum(len(moveNumbers) for moveNumbers in queues.values())
+    budget = max(searchNodeLimit - searchStats.nodes - promised, 0) // tasksLeft
+  running[connection] = (moveNumber, alpha, beta, budget)
+  connection.send((gs, validMoves[moveNumber], moveNumber, depth, alpha, beta, searchDeadline, budget, mayAbort,
+                   principalVariation, settings))
+
+'''
+  Waits for the task running on a worker and adds its statistics to searchStats.
+  Returns (score, whether the budget ran out, principal variation after the move).
+'''
+
+def receiveRootTask(connection, running):
+  del running[connection]
+  score, workerStats, aborted, line = connection.recv()
+  searchStats.add(workerStats)
+  return score, aborted, line
+
+'''
+  Worker process task for findMoveParallel: searches one root move with the given window and the caller's
+  useTablebases, useNullMove and useLateMoveReductions settings, reduced like a late move of
+  findMoveNegaMaxAlphaBeta. The transposition table, killers and history are cleared on the first task of each
+  search.
+  Returns (score from the root side's point of view, the task's SearchStats, whether the budget ran out,
+  the principal variation after the move).
+'''
+
+def searchRootMove(task):
+  global completedDepth, principalVariation, useTablebases, useNullMove, useLateMoveReductions, workerSearchNumber
+  gs, move, moveNumber, depth, alpha, beta, deadline, nodeLimit, mayAbort, line, settings = task
+  useTablebases, useNullMove, useLateMoveReductions, maxDepth, searchNumber, rootInCheck = settings
+  if searchNumber != workerSearchNumber:
+    resetSearch(maxDepth, deadline, nodeLimit)
+    transpositionTable.clear()
+    workerSearchNumber = searchNumber
+  else:
+    resetLimits(deadline, nodeLimit)
+  completedDepth = 1 if mayAbort else 0 #lets checkSearchLimits stop anything after the first iteration
+  principalVariation = line
+  turnMultiplier = 1 if gs.whiteToMove else -1
+  gs.makeMove(move)
+  reduction = lateMoveReduction(gs, move, depth, moveNumber, rootInCheck, ())
+  score = -findMoveNegaMaxAlphaBeta(gs, None, depth - 1 - reduction, -beta, -alpha, -turnMultiplier, 1)
+  if reduction and score > alpha and not searchAborted: #looks better than expected, find out at full depth
+    searchStats.reSearches += 1
+    score = -findMoveNegaMaxAlphaBeta(gs, None, depth - 1, -beta, -alpha, -turnMultiplier, 1)
+  return score, searchStats, searchAborted, pvTable[1]
+
+'''
+  Entry point for searching in a separate process: puts (move found or None, searchStats.asDict()) on returnQueue.
+  Nothing is printed, the caller decides what to do with the statistics.
+'''
+
+def findBestMoveToQueue(gs, validMoves, returnQueue, maxDepth=None, timeLimit=None, nodeLimit=None, workers=1):
+  move = findBestMove(gs, validMoves, maxDepth, timeLimit, nodeLimit, workers)
+  returnQueue.put((move, searchStats.asDict()))
+
+'''
+  The line the search expects, depth moves long at most: the moves given (the principal variation collected
+  during the search, see pvTable), continued with the transposition table's best moves where it was cut short
+  (e.g. by a table hit)
+'''
+
+def getPrincipalVariation(gs, depth, line=()):
+  line = list(line)
+  for move in line:
+    gs.makeMove(move)
+  for i in range(len(line), depth):
+    entry = transpositionTable.probe(gs.zobristKey)
+    if entry is None or entry[4] is None:
+      break
+    matches = [move for move in gs.getValidMoves() if move.moveID == entry[4]]
+    if len(matches) == 0:
+      break
+    line.append(matches[0])
+    gs.makeMove(matches[0])
+  for move in line:
+    gs.undoMove()
+  return line
+
+'''
+  Called once per node, stops the search when the node or time budget is used up or a stop was requested.
+  The first iteration always finishes.
+'''
+
+def checkSearchLimits():
+  global searchAborted
+  nodes = searchStats.nodes
+  if nodeCallback is not None and nodes % nodeCallbackInterval == 0:
+    nodeCallback(searchStats)
+  if completedDepth == 0:
+    return
+  if stopRequested:
+    searchAborted = True
+  elif searchNodeLimit is not None and nodes >= searchNodeLimit:
+    searchAborted = True
+  elif searchDeadline is not None and nodes % CHECK_INTERVAL == 0 and time.time() >= searchDeadline:
+    searchAborted = True
 
 def findMoveMinMax(gs, validMoves, depth, whiteToMove):
     global nextMove
@@ -94,44 +625,273 @@ def findMoveMinMax(gs, validMoves, depth, whiteToMove):
         gs.undoMove()
       return minScore
 
+'''
+  Sorts moves so the ones most likely to cause a cutoff come first:
+    1) the transposition table move, then the previous iteration's principal variation move for this ply
+    2) captures and promotions, most valuable victim first and among those least valuable attacker first (MVV-LVA)
+    3) the killer moves of this ply (quiet moves that caused a cutoff in a sibling node)
+    4) the other quiet moves by history score (how often and how deep they caused cutoffs anywhere in the search)
+'''
+
+HASH_MOVE_SCORE = 1000000
+PV_MOVE_SCORE = 900000
+CAPTURE_SCORE = 100000
+KILLER_SCORE = 90000 #first killer, the second one scores one less
+
+def orderMoves(validMoves, entry, ply):
+  hashMoveID = entry[4] if entry is not None else None
+  pvMoveID = principalVariation[ply].moveID if ply < len(principalVariation) else None
+  killers = killerMoves[ply] if ply < len(killerMoves) else ()
+  def moveOrderScore(move):
+    moveID = move.moveID
+    if moveID == hashMoveID:
+      return HASH_MOVE_SCORE
+    if moveID == pvMoveID:
+      return PV_MOVE_SCORE
+    if move.pieceCaptured != '--' or move.isPawnPromotion:
+      return CAPTURE_SCORE + ChessEngine.captureOrderScore(move)
+    if moveID in killers:
+      return KILLER_SCORE - killers.index(moveID)
+    return min(historyTable[moveID], KILLER_SCORE - 2)
+  validMoves.sort(key=moveOrderScore, reverse=True)
+
+'''
+  A quiet move caused a beta cutoff: remember it as a killer for this ply and credit it in the history table
+'''
+
+def recordQuietCutoff(move, depth, ply):
+  if ply < len(killerMoves):
+    killers = killerMoves[ply]
+    if killers[0] != move.moveID:
+      killers[1] = killers[0]
+      killers[0] = move.moveID
+  historyTable[move.moveID] += depth * depth
+
+'''
+  Moves the transposition table's best move for this position (if any) to the front of the list
+'''
+
+def orderHashMove(validMoves, entry):
+  if entry is not None and entry[4] is not None:
+    for i in range(len(validMoves)):
+      if validMoves[i].moveID == entry[4]:
+        validMoves.insert(0, validMoves.pop(i))
+        break
+
 def findMoveNegaMax(gs, validMoves, depth, turnMultiplier):
-  global nextMove, counter
-  counter += 1
-  if depth == 0:
+  global nextMove
+  searchStats.nodes += 1
+  if len(validMoves) == 0:
     return turnMultiplier * scoreBoard(gs)
+  if depth == 0:
+    return quiescenceSearch(gs, -CHECKMATE, CHECKMATE, turnMultiplier, 0, validMoves)
+  entry = transpositionTable.probe(gs.zobristKey)
+  if depth != DEPTH and entry is not None and entry[1] >= depth and entry[3] == EXACT:
+    return entry[2]
+  orderHashMove(validMoves, entry)
   maxScore = -CHECKMATE
+  bestMove = None
   for move in validMoves:
     gs.makeMove (move)
     nextMoves = gs.getValidMoves ()
     score = -findMoveNegaMax(gs, nextMoves, depth-1, -turnMultiplier)
-    if score > maxScore:
+    if score > maxScore or bestMove is None:
       maxScore = score
+      bestMove = move
       if depth == DEPTH:
         nextMove = move
     gs.undoMove()
-    return maxScore
+  transpositionTable.store(gs.zobristKey, depth, maxScore, EXACT, bestMove.moveID)
+  return maxScore
 
-def findMoveNegaMaxAlphaBeta(gs, validMoves ,depth, alpha, beta, turnMultiplier):
-  global nextMove, counter
-  counter += 1
-  if depth == 0:
+'''
+  Alpha-beta negamax with principal variation search: the first (best ordered) move is searched with the full
+  window, the others only with a null window around alpha to prove they are not better, and are searched again
+  with the full window when one turns out better after all. The line found is left in pvTable[ply].
+  validMoves is the root's move list; below the root it is None and the moves come from GameState.pickMoves one
+  stage at a time, so a cutoff on the hash move or a capture skips generating the quiet moves. Only the horizon
+  (depth 0) generates the full list, to score checkmate and stalemate there.
+  Two kinds of selectivity, switched by useNullMove and useLateMoveReductions:
+    null-move pruning: if passing the turn still scores at least beta in a shallower search, a real move would too,
+    so the node is cut off. Not done in check, twice in a row, near mate scores, or when the side to move has only
+    pawns (zugzwang, where passing would be best), and verified by a real reduced search when few pieces are left.
+    late move reductions: quiet moves ordered late are searched one ply (two for very late ones) shallower, and
+    again at full depth if that shows they could raise alpha.
+'''
+
+def findMoveNegaMaxAlphaBeta(gs, validMoves ,depth, alpha, beta, turnMultiplier, ply=0, allowNullMove=True):
+  global nextMove
+  searchStats.nodes += 1
+  checkSearchLimits()
+  pvTable[ply] = []
+  if ply != 0 and gs.isRepetition(): #a draw however deep we look, no need to search on
+    return STALEMATE
+  if validMoves is None and (depth == 0 or gs.isFiftyMoveDraw()): #checkmate on the fiftieth move still wins
+    validMoves = gs.getValidMoves()
+  if validMoves is not None and len(validMoves) == 0:
     return turnMultiplier * scoreBoard(gs)
-  #move ordering - implement later
+  if ply != 0 and gs.isFiftyMoveDraw():
+    return STALEMATE
+  if useTablebases and ply != 0 and gs.pieceCount <= 3:
+    score = tablebaseScore(gs)
+    if score is not None:
+      return score
+  if depth == 0:
+    return quiescenceSearch(gs, alpha, beta, turnMultiplier, ply, validMoves)
+  alphaOriginal = alpha
+  entry = transpositionTable.probe(gs.zobristKey)
+  searchStats.ttProbes += 1
+  if entry is not None:
+    searchStats.ttHits += 1
+  if ply != 0 and entry is not None and entry[1] >= depth:
+    if entry[3] == EXACT:
+      return entry[2]
+    elif entry[3] == LOWERBOUND:
+      alpha = max(alpha, entry[2])
+    elif entry[3] == UPPERBOUND:
+      beta = min(beta, entry[2])
+    if alpha >= beta:
+      return entry[2]
+  killers = tuple(killerMoves[ply]) if ply < len(killerMoves) else ()
+  if validMoves is None:
+    pvMoveID = principalVariation[ply].moveID if ply < len(principalVariation) else None
+    moves = gs.pickMoves(entry[4] if entry is not None else pvMoveID, killers, historyTable)
+  #this position's flag, the children's move generation overwrites gs.inCheck (and a caller's validMoves may have
+  #been generated before other positions were searched, e.g. the root's from the previous iteration)
+  inCheck = gs.inCheck if validMoves is None else gs.checkForPinsAndChecks()[0]
+  if (useNullMove and allowNullMove and ply != 0 and depth >= NULL_MOVE_MIN_DEPTH and not inCheck
+      and abs(beta) < CHECKMATE / 2 and turnMultiplier * scoreBoard(gs) >= beta and hasPieces(gs)):
+    reducedDepth = max(depth - 1 - NULL_MOVE_REDUCTION, 0)
+    gs.makeNullMove()
+    score = -findMoveNegaMaxAlphaBeta(gs, None, reducedDepth, -beta, -beta + NULL_WINDOW, -turnMultiplier, ply+1, False)
+    gs.undoNullMove()
+    if searchAborted:
+      return 0
+    if score >= beta:
+      if gs.pieceCount > NULL_MOVE_VERIFY_PIECES or findMoveNegaMaxAlphaBeta(
+          gs, validMoves, max(depth - NULL_MOVE_REDUCTION, 1), beta - NULL_WINDOW, beta, turnMultiplier, ply, False) >= beta:
+        searchStats.nullMoveCutoffs += 1
+        return score
+      if searchAborted:
+        return 0
+  if validMoves is not None:
+    orderMoves(validMoves, entry, ply)
+    moves = validMoves
   maxScore = -CHECKMATE
-  for move in validMoves:
+  bestMove = None
+  for moveNumber, move in enumerate(moves):
     gs.makeMove (move)
-    nextMoves = gs.getValidMoves ()
-    score= -findMoveNegaMaxAlphaBeta(gs, nextMoves, depth-1, -beta, -alpha, -turnMultiplier)
-    if score > maxScore:
+    if moveNumber == 0:
+      score= -findMoveNegaMaxAlphaBeta(gs, None, depth-1, -beta, -alpha, -turnMultiplier, ply+1)
+    else:
+      reduction = lateMoveReduction(gs, move, depth, moveNumber, inCheck, killers)
+      score = -findMoveNegaMaxAlphaBeta(gs, None, depth-1-reduction, -alpha - NULL_WINDOW, -alpha, -turnMultiplier, ply+1)
+      if reduction and score > alpha and not searchAborted: #looks better than expected, find out at full depth
+        searchStats.reSearches += 1
+        score = -findMoveNegaMaxAlphaBeta(gs, None, depth-1, -alpha - NULL_WINDOW, -alpha, -turnMultiplier, ply+1)
+      if alpha < score < beta and not searchAborted: #better than the first move: get its exact score
+        searchStats.reSearches += 1
+        score = -findMoveNegaMaxAlphaBeta(gs, None, depth-1, -beta, -alpha, -turnMultiplier, ply+1)
+    gs.undoMove()
+    if searchAborted: #unfinished result, must not be used or stored
+      return 0
+    if score > maxScore or bestMove is None:
       maxScore = score
-      if depth == DEPTH:
+      bestMove = move
+      if ply == 0:
         nextMove = move
-    gs.undoMove()
+      if score > alpha:
+        pvTable[ply] = [move] + pvTable[ply+1]
     if maxScore > alpha: #pruning happens
       alpha = maxScore
     if alpha >= beta:
+      searchStats.betaCutoffs += 1
+      if moveNumber == 0:
+        searchStats.firstMoveCutoffs += 1
+      if move.pieceCaptured == '--' and not move.isPawnPromotion:
+        recordQuietCutoff(move, depth, ply)
       break
-    return maxScore
+  if bestMove is None: #the picker found no legal move and has set checkmate or stalemate
+    return turnMultiplier * scoreBoard(gs)
+  if maxScore <= alphaOriginal:
+    bound = UPPERBOUND
+  elif maxScore >= beta:
+    bound = LOWERBOUND
+  else:
+    bound = EXACT
+  transpositionTable.store(gs.zobristKey, depth, maxScore, bound, bestMove.moveID)
+  return maxScore
+
+'''
+  Late move reductions: how many plies shallower the move just made is searched first. Only quiet moves ordered
+  late get reduced, and not killers, evasions or moves that give check.
+'''
+
+def lateMoveReduction(gs, move, depth, moveNumber, inCheck, killers):
+  if (useLateMoveReductions and depth >= LMR_MIN_DEPTH and moveNumber >= LMR_FULL_DEPTH_MOVES and not inCheck
+      and move.pieceCaptured == '--' and not move.isPawnPromotion and move.moveID not in killers
+      and not gs.checkForPinsAndChecks()[0]):
+    searchStats.reductions += 1
+    return 2 if depth >= 5 and moveNumber >= 4 * LMR_FULL_DEPTH_MOVES else 1
+  return 0
+
+'''
+  True if the side to move has a piece other than pawns and its king (null-move pruning is unsafe without one)
+'''
+
+def hasPieces(gs):
+  color = 'w' if gs.whiteToMove else 'b'
+  for row in gs.board:
+    for square in row:
+      if square[0] == color and square[1] in 'NBRQ':
+        return True
+  return False
+
+'''
+  Quiescence search: at the horizon keep playing captures and promotions until the position is quiet, so a score
+  is never taken in the middle of an exchange. The side to move may "stand pat" on the static score instead of
+  capturing, which gives the cutoffs. In check there is no standing pat and every evasion is searched.
+  validMoves, if given, are the already generated legal moves of this position and are filtered instead of
+  generating captures again.
+'''
+
+def quiescenceSearch(gs, alpha, beta, turnMultiplier, ply, validMoves=None):
+  if validMoves is None:
+    searchStats.nodes += 1
+    searchStats.qnodes += 1
+    checkSearchLimits()
+    moves = gs.getValidMoves(capturesOnly=True)
+    if gs.checkmate:
+      return turnMultiplier * scoreBoard(gs)
+    inCheck = gs.inCheck
+  else:
+    inCheck = gs.checkForPinsAndChecks()[0] #the flags may be from another position since validMoves was generated
+    if inCheck:
+      moves = validMoves
+    else:
+      moves = [move for move in validMoves if move.pieceCaptured != '--' or move.isPawnPromotion]
+  if inCheck:
+    maxScore = -CHECKMATE
+  else:
+    maxScore = turnMultiplier * scoreBoard(gs) #stand pat
+    if maxScore >= beta:
+      return maxScore
+    if maxScore > alpha:
+      alpha = maxScore
+  orderMoves(moves, None, ply)
+  for move in moves:
+    gs.makeMove(move)
+    score = -quiescenceSearch(gs, -beta, -alpha, -turnMultiplier, ply+1)
+    gs.undoMove()
+    if searchAborted:
+      return 0
+    if score > maxScore:
+      maxScore = score
+      if maxScore > alpha:
+        alpha = maxScore
+      if alpha >= beta:
+        break
+  return maxScore
 
 def scoreBoard(gs):
     if gs.checkmate:
@@ -141,16 +901,14 @@ def scoreBoard(gs):
         return CHECKMATE #white wins
     elif gs.stalemate:
        return STALEMATE
-    score = 0
-    for row in gs.board:
-      for square in row:
-        if square[0] == 'w':
-          score += pieceScore[square[1]]
-        elif square [0] == 'b':
-          score -= pieceScore[square[1]]
-    return score
+    #both sums are maintained by makeMove/undoMove, no board scan needed
+    return gs.materialScore + gs.positionScore * POSITION_WEIGHT
       
      
+'''
+  Material only, counted from a bare board (no GameState needed)
+'''
+
 def scoreMaterial(board):
   score = 0
   for row in board:
@@ -0,0 +1,248 @@
+"""
+  Endgame tablebases for king + one piece against a lone king (KQK, KRK, KPK, ...), generated locally by
+  retrograde analysis with ChessEngine.GameState's move rules.
+
+  A table has one byte per position, indexed by (side to move, strong king, weak king, piece square), with the
+  strong side always seen as white (positions where black has the piece are mirrored). A byte holds 0 for a draw
+  or an impossible position, otherwise 1 + the number of plies to mate: an odd number of plies is a win for
+  the side to move, an even number a loss (1 = already checkmated). Probing is a single index lookup.
+
+  python Tablebase.py generate KQK KRK KPK
+  python Tablebase.py probe --fen "<fen>"
+"""
+
+import os
+import sys
+from array import array
+
+import ChessEngine
+
+TABLEBASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tablebases")
+TABLE_SIZE = 2 * 64 * 64 * 64
+
+WIN = 1
+DRAW = 0
+LOSS = -1
+
+loadedTables = {}                                                   # piece type -> bytes, None if no file
+
+
+def tableName(pieceType):
+    return "K" + pieceType.upper() + "K"
+
+
+def tablePath(pieceType, directory=None):
+    return os.path.join(directory or TABLEBASE_DIR, tableName(pieceType) + ".tb")
+
+
+def positionIndex(strongToMove, strongKingSq, weakKingSq, pieceSq):
+    return (((0 if strongToMove else 1) * 64 + strongKingSq) * 64 + weakKingSq) * 64 + pieceSq
+
+
+def decode(value):
+    """
+    (WIN/DRAW/LOSS, plies to mate) for a stored byte, from the side to move's point of view.
+    """
+    if value == 0:
+        return DRAW, 0
+    plies = value - 1
+    return (WIN if plies % 2 == 1 else LOSS), plies
+
+
+def getTable(pieceType, directory=None):
+    if pieceType not in loadedTables:
+        path = tablePath(pieceType, directory)
+        if os.path.exists(path):
+            with open(path, "rb") as tableFile:
+                loadedTables[pieceType] = tableFile.read()
+        else:
+            loadedTables[pieceType] = None
+    return loadedTables[pieceType]
+
+
+def probe(gs):
+    """
+    (WIN/DRAW/LOSS, plies to mate) for the side to move, or None when the position has no table.
+    Bare kings are a draw.
+    """
+    if gs.pieceCount > 3:
+        return None
+    if gs.pieceCount == 2:
+        return DRAW, 0
+    piece = None
+    for r in range(8):
+        for c in range(8):
+            square = gs.board[r][c]
+            if square != "--" and square[1] != "K":
+                piece, pieceRow, pieceCol = square, r, c
+    table = getTable(piece[1])
+    if table is None:
+        return None
+    if piece[0] == "w":
+        strongKing, weakKing = gs.whiteKingLocation, gs.blackKingLocation
+        flip = lambda r: r
+    else:                                                           # mirror so the strong side is white
+        strongKing, weakKing = gs.blackKingLocation, gs.whiteKingLocation
+        flip = lambda r: 7 - r
+    strongToMove = gs.whiteToMove == (piece[0] == "w")
+    index = positionIndex(strongToMove, flip(strongKing[0]) * 8 + strongKing[1],
+                          flip(weakKing[0]) * 8 + weakKing[1], flip(pieceRow) * 8 + pieceCol)
+    return decode(table[index])
+
+
+def setupPosition(gs, strongToMove, strongKingSq, weakKingSq, pieceSq, piece):
+    """
+    Puts the three pieces on an empty board (strong side white). False if the squares overlap or a pawn
+    stands on its first or last rank.
+    """
+    if strongKingSq == weakKingSq or pieceSq == strongKingSq or pieceSq == weakKingSq:
+        return False
+    if piece == "wp" and (pieceSq < 8 or pieceSq >= 56):
+        return False
+    gs.board = [["--"] * 8 for r in range(8)]
+    gs.board[strongKingSq // 8][strongKingSq % 8] = "wK"
+    gs.board[weakKingSq // 8][weakKingSq % 8] = "bK"
+    gs.board[pieceSq // 8][pieceSq % 8] = piece
+    gs.whiteKingLocation = (strongKingSq // 8, strongKingSq % 8)
+    gs.blackKingLocation = (weakKingSq // 8, weakKingSq % 8)
+    gs.whiteToMove = strongToMove
+    gs.enpassantPossible = ()
+    return True
+
+
+def generate(pieceType, directory=None, verbose=False):
+    """
+    Builds the table for king + pieceType against king and writes it to the tablebase directory.
+    KPK needs KQK for positions after promotion and builds it first if it is missing.
+    """
+    directory = directory or TABLEBASE_DIR
+    promotionTable = None
+    if pieceType == "p":
+        if getTable("Q", directory) is None:
+            generate("Q", directory, verbose)
+        promotionTable = getTable("Q", directory)
+    piece = "w" + pieceType
+    gs = ChessEngine.GameState()
+
+    # forward pass: legal moves of every position as child indices, collected into flat arrays
+    successorStart = array("l", [0]) * (TABLE_SIZE + 1)
+    successors = array("l")
+    remaining = array("H", [0]) * TABLE_SIZE                       # moves not (yet) known to lose for the mover
+    values = array("B", [0]) * TABLE_SIZE
+    buckets = [[] for plies in range(256)]                         # plies -> positions / promotion results at that distance
+    for index in range(TABLE_SIZE):
+        successorStart[index] = len(successors)
+        pieceSq = index % 64
+        weakKingSq = index // 64 % 64
+        strongKingSq = index // 4096 % 64
+        strongToMove = index < TABLE_SIZE // 2
+        if not setupPosition(gs, strongToMove, strongKingSq, weakKingSq, pieceSq, piece):
+            continue
+        gs.whiteToMove = not strongToMove                          # the side that just moved may not be in check
+        if gs.checkForPinsAndChecks()[0]:
+            continue
+        gs.whiteToMove = strongToMove
+        moves = gs.getValidMoves()
+        if len(moves) == 0:
+            if gs.checkmate:
+                values[index] = 1
+                buckets[0].append(index)
+            continue
+        remaining[index] = len(moves)
+        for move in moves:
+            endSq = move.endRow * 8 + move.endCol
+            if move.pieceCaptured != "--":                          # the piece is gone: bare kings, a draw
+                continue
+            if move.pieceMoved == "bK":
+                successors.append(positionIndex(True, strongKingSq, endSq, pieceSq))
+            elif move.pieceMoved == "wK":
+                successors.append(positionIndex(False, endSq, weakKingSq, pieceSq))
+            elif move.isPawnPromotion:
+                result, plies = decode(promotionTable[positionIndex(False, strongKingSq, weakKingSq, endSq)])
+                if result != DRAW:
+                    buckets[plies].append((index, result))
+            else:
+                successors.append(positionIndex(False, strongKingSq, weakKingSq, endSq))
+        if verbose and index % 65536 == 0:
+            print("%s: %d%% of positions expanded" % (tableName(pieceType), 100 * index // TABLE_SIZE))
+    successorStart[TABLE_SIZE] = len(successors)
+
+    # reverse the move graph so every solved position can update the positions that lead to it
+    predecessorStart = array("l", [0]) * (TABLE_SIZE + 1)
+    for child in successors:
+        predecessorStart[child + 1] += 1
+    for index in range(TABLE_SIZE):
+        predecessorStart[index + 1] += predecessorStart[index]
+    fill = array("l", predecessorStart)
+    predecessors = array("l", [0]) * len(successors)
+    for parent in range(TABLE_SIZE):
+        for i in range(successorStart[parent], successorStart[parent + 1]):
+            child = successors[i]
+            predecessors[fill[child]] = parent
+            fill[child] += 1
+
+    # retrograde pass in order of distance to mate: a position is won as soon as one move reaches a lost
+    # position, and lost once every move reaches a won one
+    def childSolved(parent, childResult, plies):
+        if values[parent] != 0:
+            return
+        if childResult == LOSS:
+            values[parent] = plies + 2
+            buckets[plies + 1].append(parent)
+        else:
+            remaining[parent] -= 1
+            if remaining[parent] == 0:
+                values[parent] = plies + 2
+                buckets[plies + 1].append(parent)
+
+    for plies in range(255):
+        for entry in buckets[plies]:
+            if isinstance(entry, tuple):                            # promotion into a solved KQK position
+                parent, childResult = entry
+                childSolved(parent, childResult, plies)
+                continue
+            childResult = decode(values[entry])[0]
+            for i in range(predecessorStart[entry], predecessorStart[entry + 1]):
+                childSolved(predecessors[i], childResult, plies)
+
+    os.makedirs(directory, exist_ok=True)
+    with open(tablePath(pieceType, directory), "wb") as tableFile:
+        values.tofile(tableFile)
+    loadedTables.pop(pieceType, None)
+    if verbose:
+        longest = max(values)
+        print("%s written, longest mate %d plies" % (tableName(pieceType), longest - 1 if longest else 0))
+    return tablePath(pieceType, directory)
+
+
+def main(argv=None):
+    import argparse                                                 # here: the engine imports this module, the CLI is rare
+    parser = argparse.ArgumentParser(description="Generate or probe king + piece vs king tablebases")
+    commands = parser.add_subparsers(dest="command", required=True)
+    generateCommand = commands.add_parser("generate", help="build tables, e.g. KQK KRK KPK")
+    generateCommand.add_argument("tables", nargs="+")
+    probeCommand = commands.add_parser("probe", help="look up a position")
+    probeCommand.add_argument("--fen", required=True)
+    args = parser.parse_args(argv)
+
+    if args.command == "generate":
+        for name in args.tables:
+            name = name.upper()
+            if len(name) != 3 or name[0] != "K" or name[2] != "K" or name[1] not in "QRBNP":
+                parser.error("unknown table " + name)
+            generate(name[1] if name[1] != "P" else "p", verbose=True)
+        return 0
+
+    gs = ChessEngine.GameState()
+    gs.loadFen(args.fen)
+    result = probe(gs)
+    if result is None:
+        print("not in the tablebases")
+    else:
+        outcome, plies = result
+        print({WIN: "win", DRAW: "draw", LOSS: "loss"}[outcome] + ("" if outcome == DRAW else " in %d plies" % plies))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,237 @@
+"""
+  Headless self-play: two SmartMoveFinder configurations play a match across a process pool, no display needed.
+  Every opening is played twice with colors swapped. Finished games are streamed to a PGN and/or JSONL file as
+  they come in, and the match is reported as wins/draws/losses of the first engine with a 95% error bar.
+
+  python Tournament.py --games 1000 --engine1 depth=3 --engine2 depth=2
+  python Tournament.py --games 200 --engine1 time=0.5,name=new --engine2 nodes=20000,book=0 --pgn out.pgn --jsonl out.jsonl
+
+  Engine options (comma separated key=value): name, depth, time (seconds per move), nodes, book (0/1),
+  tablebases (0/1), nullmove (0/1), lmr (0/1, late move reductions), hash (transposition table size in bits).
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+from multiprocessing import Pool
+
+import ChessEngine
+import Pgn
+import SmartMoveFinder
+
+STARTPOS = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w - - 0 1"
+
+
+def parseEngine(spec, defaultName):
+    """
+    Engine settings dict from a "key=value,key=value" string.
+    """
+    engine = {"name": defaultName, "depth": None, "time": None, "nodes": None, "book": True, "tablebases": True,
+              "nullmove": True, "lmr": True, "hash": 18}
+    for option in filter(None, spec.split(",")):
+        key, separator, value = option.partition("=")
+        if key not in engine or separator == "":
+            raise ValueError("unknown engine option " + option)
+        if key == "name":
+            engine[key] = value
+        elif key == "time":
+            engine[key] = float(value)
+        elif key in ("book", "tablebases", "nullmove", "lmr"):
+            engine[key] = value not in ("0", "false", "no")
+        else:
+            engine[key] = int(value)
+    return engine
+
+
+def openingPosition(opening, randomPlies, seed):
+    """
+    GameState for a game: the opening FEN followed by randomPlies random moves chosen from seed
+    (the same seed gives the same opening, so a color swapped pair starts from the same position).
+    """
+    gs = ChessEngine.GameState()
+    gs.loadFen(opening)
+    rng = random.Random(seed)
+    for ply in range(randomPlies):
+        validMoves = gs.getValidMoves()
+        if len(validMoves) == 0:
+            break
+        gs.makeMove(rng.choice(validMoves))
+    return gs
+
+
+def playGame(task):
+    """
+    Pool worker: plays one game. Returns a dict with the result, the SAN moves and per side nodes and seconds.
+    """
+    gameNumber, white, black, opening, randomPlies, openingSeed, maxPlies = task
+    random.seed(openingSeed * 2 + gameNumber % 2)                   # book choices
+    gs = openingPosition(opening, randomPlies, openingSeed)
+    book = SmartMoveFinder.getOpeningBook()                         # opened once per process, switched per side
+    tables = {"w": SmartMoveFinder.TranspositionTable(white["hash"]),
+              "b": SmartMoveFinder.TranspositionTable(black["hash"])}
+    nodes = {"w": 0, "b": 0}
+    seconds = {"w": 0.0, "b": 0.0}
+    sanMoves = []
+    replay = ChessEngine.GameState()                                # SAN has to be written from the opening position on
+    replay.loadFen(opening)
+    for move in gs.movelog:
+        sanMoves.append(Pgn.moveToSan(replay, move))
+        replay.makeMove(move)
+
+    result, termination = None, None
+    while result is None:
+        validMoves = gs.getValidMoves()
+        if gs.checkmate:
+            result, termination = ("0-1" if gs.whiteToMove else "1-0"), "checkmate"
+        elif gs.stalemate:
+            result, termination = "1/2-1/2", "stalemate"
+        elif gs.pieceCount == 2:
+            result, termination = "1/2-1/2", "insufficient material"
+        elif gs.isThreefoldRepetition():
+            result, termination = "1/2-1/2", "threefold repetition"
+        elif gs.isFiftyMoveDraw():
+            result, termination = "1/2-1/2", "fifty-move rule"
+        elif len(gs.movelog) >= maxPlies:
+            result, termination = "1/2-1/2", "move limit"
+        else:
+            side = "w" if gs.whiteToMove else "b"
+            engine = white if gs.whiteToMove else black
+            SmartMoveFinder.transpositionTable = tables[side]
+            SmartMoveFinder.useTablebases = engine["tablebases"]
+            SmartMoveFinder.useNullMove = engine["nullmove"]
+            SmartMoveFinder.useLateMoveReductions = engine["lmr"]
+            SmartMoveFinder.openingBook = book if engine["book"] else None
+            start = time.perf_counter()
+            move, stats = SmartMoveFinder.findBestMoveWithStats(gs, validMoves, engine["depth"], engine["time"],
+                                                                engine["nodes"])
+            seconds[side] += time.perf_counter() - start
+            nodes[side] += stats.nodes
+            if move is None:
+                move = SmartMoveFinder.findRandomMove(validMoves)
+            sanMoves.append(Pgn.moveToSan(gs, move, validMoves))
+            gs.makeMove(move)
+    return {"game": gameNumber, "white": white["name"], "black": black["name"], "result": result,
+            "termination": termination, "plies": len(gs.movelog), "opening": opening, "openingPlies": randomPlies,
+            "moves": sanMoves, "nodes": {"white": nodes["w"], "black": nodes["b"]},
+            "seconds": {"white": round(seconds["w"], 3), "black": round(seconds["b"], 3)}}
+
+
+def matchScore(wins, draws, losses):
+    """
+    (score fraction, 95% error bar) of a match from the first engine's point of view.
+    """
+    games = wins + draws + losses
+    if games == 0:
+        return 0.5, 0.0
+    score = (wins + 0.5 * draws) / games
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    return score, 1.96 * math.sqrt(variance / games)
+
+
+def eloDifference(score):
+    if score <= 0.0:
+        return -math.inf
+    if score >= 1.0:
+        return math.inf
+    return -400 * math.log10(1 / score - 1)
+
+
+def runMatch(engine1, engine2, games, processes=None, openings=None, randomPlies=4, maxPlies=300,
+             pgnPath=None, jsonlPath=None, seed=1, progress=True):
+    """
+    Plays games between two engines (colors alternating, each opening twice) and returns (wins, draws, losses)
+    of engine1. openings is a list of FENs cycled through, the start position when not given.
+    """
+    openings = openings or [STARTPOS]
+    tasks = []
+    for gameNumber in range(games):
+        pair = gameNumber // 2
+        white, black = (engine1, engine2) if gameNumber % 2 == 0 else (engine2, engine1)
+        tasks.append((gameNumber, white, black, openings[pair % len(openings)], randomPlies, seed + pair, maxPlies))
+
+    pgnFile = open(pgnPath, "w") if pgnPath else None
+    jsonlFile = open(jsonlPath, "w") if jsonlPath else None
+    wins = draws = losses = 0
+    totalNodes = 0
+    totalSeconds = 0.0
+    try:
+        with Pool(processes) as pool:
+            for game in pool.imap_unordered(playGame, tasks):
+                if game["result"] == "1/2-1/2":
+                    draws += 1
+                elif (game["result"] == "1-0") == (game["white"] == engine1["name"]):
+                    wins += 1
+                else:
+                    losses += 1
+                gameNodes = game["nodes"]["white"] + game["nodes"]["black"]
+                gameSeconds = game["seconds"]["white"] + game["seconds"]["black"]
+                totalNodes += gameNodes
+                totalSeconds += gameSeconds
+                if pgnFile:
+                    headers = {"Event": "Self-play", "Round": game["game"] + 1, "White": game["white"],
+                               "Black": game["black"], "Result": game["result"], "Termination": game["termination"]}
+                    if game["opening"] != STARTPOS:
+                        headers["SetUp"] = "1"
+                        headers["FEN"] = game["opening"]
+                    pgnFile.write(Pgn.formatGame(headers, game["moves"], game["result"]) + "\n")
+                    pgnFile.flush()
+                if jsonlFile:
+                    jsonlFile.write(json.dumps(game) + "\n")
+                    jsonlFile.flush()
+                if progress:
+                    score, errorBar = matchScore(wins, draws, losses)
+                    print("game %4d  %-7s %-22s %3d plies  %9d nodes  %7.2fs   +%d =%d -%d  score %.3f +/- %.3f"
+                          % (game["game"] + 1, game["result"], game["termination"], game["plies"], gameNodes,
+                             gameSeconds, wins, draws, losses, score, errorBar))
+    finally:
+        if pgnFile:
+            pgnFile.close()
+        if jsonlFile:
+            jsonlFile.close()
+
+    score, errorBar = matchScore(wins, draws, losses)
+    print("%s vs %s: +%d =%d -%d  score %.3f +/- %.3f  elo %+.0f [%+.0f, %+.0f]"
+          % (engine1["name"], engine2["name"], wins, draws, losses, score, errorBar, eloDifference(score),
+             eloDifference(score - errorBar), eloDifference(score + errorBar)))
+    if totalSeconds > 0:
+        print("%d nodes in %.1fs of search, %.0f nps" % (totalNodes, totalSeconds, totalNodes / totalSeconds))
+    return wins, draws, losses
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless engine vs engine matches")
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--engine1", default="depth=2", help="settings of the engine under test")
+    parser.add_argument("--engine2", default="depth=2", help="settings of the reference engine")
+    parser.add_argument("--processes", type=int, default=os.cpu_count(), help="games played at once")
+    parser.add_argument("--openings", help="file of opening FENs, one per line (default: the start position)")
+    parser.add_argument("--random-plies", type=int, default=4, help="random moves played after each opening")
+    parser.add_argument("--max-plies", type=int, default=300, help="games this long are scored as draws")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--pgn", help="write games to this PGN file")
+    parser.add_argument("--jsonl", help="write games to this file as one JSON object per line")
+    parser.add_argument("--quiet", action="store_true", help="only print the final result")
+    args = parser.parse_args(argv)
+
+    try:
+        engine1 = parseEngine(args.engine1, "engine1")
+        engine2 = parseEngine(args.engine2, "engine2")
+    except ValueError as error:
+        parser.error(str(error))
+    if engine1["name"] == engine2["name"]:
+        parser.error("the two engines need different names")
+    openings = None
+    if args.openings:
+        with open(args.openings) as openingsFile:
+            openings = [line.strip() for line in openingsFile if line.strip()]
+    runMatch(engine1, engine2, args.games, args.processes, openings, args.random_plies, args.max_plies,
+             args.pgn, args.jsonl, args.seed, not args.quiet)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,228 @@
+"""
+  UCI (Universal Chess Interface) front end: lets GUIs, match managers and scripts drive the engine over
+  stdin/stdout without pygame.
+
+  Supported: uci, isready, ucinewgame, setoption (Hash, OwnBook), position startpos|fen ... [moves ...],
+  go [depth N] [movetime MS] [wtime MS] [btime MS] [winc MS] [binc MS] [movestogo N] [nodes N] [infinite],
+  stop, quit. The search runs in a thread so stop and isready are answered while it thinks; it reports an info
+  line per completed iteration and nodes/nps once a second. After "go infinite" bestmove is only sent once
+  stop arrives, even if the search ends earlier (mate found or depth cap reached).
+  The engine cannot castle or under-promote, so a position whose move list contains such a move stops
+  at that move (reported as an info string).
+
+  python Uci.py
+"""
+
+import math
+import sys
+import threading
+import time
+
+import ChessEngine
+import SmartMoveFinder
+
+ENGINE_NAME = "Chess-Project"
+MOVE_OVERHEAD = 0.05                                                # seconds kept back for communication per move
+TABLE_ENTRY_BYTES = 128                                             # rough size of one transposition table slot
+
+
+def moveToUci(move):
+    return move.getChessNotation() + ("q" if move.isPawnPromotion else "")
+
+
+def findUciMove(gs, text):
+    """
+    The legal move of gs written as text (e.g. "e2e4", "e7e8q"), or None.
+    """
+    if len(text) == 5 and text[4] != "q":                           # only queen promotions are played
+        return None
+    for move in gs.getValidMoves():
+        if move.getChessNotation() == text[:4] and (len(text) == 5) == move.isPawnPromotion:
+            return move
+    return None
+
+
+def scoreToUci(score, pv):
+    """
+    "cp N" or "mate N" for a search score (pawns, side to move's point of view).
+    Tablebase wins score CHECKMATE less the plies to mate, a mate found by the search scores CHECKMATE itself.
+    """
+    if abs(score) >= SmartMoveFinder.CHECKMATE - 255:
+        plies = SmartMoveFinder.CHECKMATE - abs(score) if abs(score) < SmartMoveFinder.CHECKMATE else len(pv)
+        moves = (plies + 1) // 2
+        return "mate %d" % (moves if score > 0 else -moves)
+    return "cp %d" % round(score * 100)
+
+
+def searchTime(gs, limits):
+    """
+    Seconds to spend on this move from the go command's clock fields, or None for no time limit.
+    """
+    if "movetime" in limits:
+        return max(limits["movetime"] / 1000 - MOVE_OVERHEAD, 0.01)
+    remaining = limits.get("wtime" if gs.whiteToMove else "btime")
+    if remaining is None:
+        return None
+    increment = limits.get("winc" if gs.whiteToMove else "binc", 0)
+    movesToGo = limits.get("movestogo", 30)
+    budget = remaining / movesToGo + increment * 0.75
+    return max(min(budget, remaining / 2) / 1000 - MOVE_OVERHEAD, 0.01)
+
+
+class UciEngine():
+    def __init__( self, output=None ):
+        self.output = output or sys.stdout
+        self.outputLock = threading.Lock()
+        self.gs = ChessEngine.GameState()
+        self.searchThread = None
+        self.stopEvent = threading.Event()                          # set by stop, awaited by an infinite search
+        self.searchStart = 0.0
+        self.book = SmartMoveFinder.getOpeningBook()
+        self.ownBook = True
+
+    def send( self, line ):
+        with self.outputLock:
+            self.output.write(line + "\n")
+            self.output.flush()
+
+    def handle( self, line ):
+        """
+        Runs one command line. Returns False on quit.
+        """
+        tokens = line.split()
+        if len(tokens) == 0:
+            return True
+        command, arguments = tokens[0], tokens[1:]
+        if command == "uci":
+            self.send("id name " + ENGINE_NAME)
+            self.send("id author " + ENGINE_NAME + " contributors")
+            self.send("option name Hash type spin default 32 min 1 max 1024")
+            self.send("option name OwnBook type check default true")
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "ucinewgame":
+            self.stop()
+            SmartMoveFinder.transpositionTable.clear()
+            self.gs = ChessEngine.GameState()
+        elif command == "setoption":
+            self.setOption(arguments)
+        elif command == "position":
+            self.stop()
+            self.setPosition(arguments)
+        elif command == "go":
+            self.stop()
+            self.go(arguments)
+        elif command == "stop":
+            self.stop()
+        elif command == "quit":
+            self.stop()
+            return False
+        return True
+
+    def setOption( self, arguments ):
+        text = " ".join(arguments)
+        if not text.startswith("name ") or " value " not in text:
+            return
+        name, value = text[5:].split(" value ", 1)
+        name = name.strip().lower()
+        value = value.strip()
+        if name == "hash":                                          # megabytes, rounded down to a power of two of slots
+            slots = max(int(value), 1) * 1024 * 1024 // TABLE_ENTRY_BYTES
+            SmartMoveFinder.transpositionTable = SmartMoveFinder.TranspositionTable(int(math.log2(slots)))
+        elif name == "ownbook":
+            self.ownBook = value.lower() == "true"
+
+    def setPosition( self, arguments ):
+        gs = ChessEngine.GameState()
+        if arguments[:1] == ["fen"]:
+            fenFields = arguments[1:arguments.index("moves")] if "moves" in arguments else arguments[1:]
+            gs.loadFen(" ".join(fenFields))
+        elif arguments[:1] != ["startpos"]:
+            return
+        if "moves" in arguments:
+            for text in arguments[arguments.index("moves") + 1:]:
+                move = findUciMove(gs, text)
+                if move is None:
+                    self.send("info string cannot play " + text + ", position set before it")
+                    break
+                gs.makeMove(move)
+        self.gs = gs
+
+    def go( self, arguments ):
+        limits = {}
+        for i in range(len(arguments) - 1):
+            if arguments[i] in ("depth", "movetime", "wtime", "btime", "winc", "binc", "movestogo", "nodes"):
+                limits[arguments[i]] = int(arguments[i + 1])
+        if "infinite" in arguments:
+            maxDepth = SmartMoveFinder.MAX_DEPTH
+        else:
+            maxDepth = limits.get("depth")
+        timeLimit = None if "infinite" in arguments else searchTime(self.gs, limits)
+        nodeLimit = limits.get("nodes")
+        if maxDepth is None and timeLimit is None and nodeLimit is None:
+            maxDepth = SmartMoveFinder.DEPTH
+        SmartMoveFinder.stopRequested = False
+        self.stopEvent.clear()
+        self.searchStart = time.time()
+        self.searchThread = threading.Thread(target=self.search,
+                                             args=(self.gs, maxDepth, timeLimit, nodeLimit, "infinite" in arguments))
+        self.searchThread.start()
+
+    def search( self, gs, maxDepth, timeLimit, nodeLimit, infinite=False ):
+        """
+        Search thread: reports progress and finishes with the bestmove line, for an infinite search not before stop.
+        """
+        finished = threading.Event()
+        reporter = threading.Thread(target=self.reportProgress, args=(finished,))
+        reporter.start()
+        validMoves = gs.getValidMoves()
+        bestMove = None
+        if len(validMoves) > 0:
+            SmartMoveFinder.openingBook = self.book if self.ownBook else None
+            bestMove = SmartMoveFinder.findBestMove(gs, validMoves, maxDepth, timeLimit, nodeLimit,
+                                                    onIteration=self.reportIteration)
+            if bestMove is None:
+                bestMove = validMoves[0]
+        finished.set()
+        reporter.join()
+        if infinite:
+            self.stopEvent.wait()
+        self.send("bestmove " + (moveToUci(bestMove) if bestMove is not None else "0000"))
+
+    def reportIteration( self, stats ):
+        elapsed = max(time.time() - self.searchStart, 1e-6)
+        self.send("info depth %d score %s nodes %d nps %d time %d pv %s"
+                  % (stats.depth, scoreToUci(stats.score, stats.principalVariation), stats.nodes,
+                     stats.nodes / elapsed, elapsed * 1000,
+                     " ".join(moveToUci(move) for move in stats.principalVariation)))
+
+    def reportProgress( self, finished ):
+        while not finished.wait(1.0):
+            elapsed = max(time.time() - self.searchStart, 1e-6)
+            nodes = SmartMoveFinder.searchStats.nodes
+            self.send("info nodes %d nps %d time %d" % (nodes, nodes / elapsed, elapsed * 1000))
+
+    def stop( self ):
+        """
+        Ends a running search (it still prints its bestmove) and waits for it.
+        """
+        if self.searchThread is not None:
+            SmartMoveFinder.stopRequested = True
+            self.stopEvent.set()
+            self.searchThread.join()
+            self.searchThread = None
+            SmartMoveFinder.stopRequested = False
+
+
+def main():
+    engine = UciEngine()
+    for line in sys.stdin:
+        if not engine.handle(line.strip()):
+            break
+    engine.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,8 @@
+"""
+  The engine modules import each other by their flat names (import ChessEngine), so tests run with Chess/ on the path.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Chess"))
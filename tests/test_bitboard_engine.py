@@ -0,0 +1,35 @@
+import random
+
+import BitboardEngine
+import ChessEngine
+
+
+def moveKeys(moves):
+    """
+    The moves with everything makeMove uses, in moveID order: the backends generate the pieces in different orders.
+    """
+    return sorted((move.moveID, move.pieceMoved, move.pieceCaptured, move.isPawnPromotion, move.isEnpassantMove)
+                  for move in moves)
+
+
+def testRandomGamesGenerateTheSameMoves():
+    rng = random.Random(20240613)
+    for game in range(12):
+        mailbox = ChessEngine.GameState()
+        bitboard = BitboardEngine.BitboardGameState()
+        for ply in range(120):
+            moves = mailbox.getValidMoves()
+            bitboardMoves = bitboard.getValidMoves()
+            assert moveKeys(bitboardMoves) == moveKeys(moves), mailbox.getFen()
+            assert (bitboard.inCheck, bitboard.checkmate, bitboard.stalemate) == \
+                (mailbox.inCheck, mailbox.checkmate, mailbox.stalemate), mailbox.getFen()
+            if len(moves) == 0:
+                break
+            if len(mailbox.movelog) > 0 and rng.random() < 0.1:     # take a move back now and then
+                mailbox.undoMove()
+                bitboard.undoMove()
+            else:
+                move = rng.choice(moves)
+                mailbox.makeMove(move)
+                bitboard.makeMove(next(m for m in bitboardMoves if m.moveID == move.moveID))
+            assert bitboard.getFen() == mailbox.getFen()
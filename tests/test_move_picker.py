@@ -0,0 +1,69 @@
+import random
+
+import pytest
+
+import Perft
+
+FENS = [
+    Perft.STARTPOS,
+    "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+    "rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w - f6 0 3",          # en passant
+    "8/P5k1/8/8/8/8/6Kp/8 w - - 0 1",                                     # promotions
+    "4k3/8/8/8/1b6/8/2P5/4K3 w - - 0 1",                                  # check, a pawn can block
+    "4r1k1/8/8/8/8/3n4/8/4K3 w - - 0 1",                                  # double check
+    "rnb1kbnr/pppp1ppp/8/4p3/6Pq/5P2/PPPPP2P/RNBQKBNR w - - 1 3",         # checkmate
+    "7k/5Q2/6K1/8/8/8/8/8 b - - 0 1",                                     # stalemate
+]
+
+
+def randomMoveID(rng, moves):
+    """
+    None, the moveID of a legal move, or any moveID (mostly not legal here), as a hash or killer move can be.
+    """
+    kind = rng.randrange(3)
+    if kind == 0:
+        return None
+    if kind == 1 and len(moves) > 0:
+        return rng.choice(moves).moveID
+    return rng.randrange(4096)
+
+
+def checkPicker(gs, rng):
+    expected = gs.getValidMoves()
+    flags = (gs.checkmate, gs.stalemate)
+    fen = gs.getFen()
+    hashMoveID = randomMoveID(rng, expected)
+    killers = (randomMoveID(rng, expected), randomMoveID(rng, expected))
+    history = [rng.randrange(1000) for moveID in range(4096)]
+    picked = []
+    for move in gs.pickMoves(hashMoveID, killers, history):
+        picked.append(move.moveID)
+        gs.makeMove(move)                                               # the search's work between two yields
+        replies = gs.pickMoves(randomMoveID(rng, []), (), history)
+        reply = next(replies, None)
+        if reply is not None:
+            gs.makeMove(reply)
+            gs.getValidMoves()
+            gs.undoMove()
+        gs.undoMove()
+    assert len(picked) == len(set(picked)), fen                        # no move twice
+    assert sorted(picked) == sorted(move.moveID for move in expected), fen
+    assert (gs.checkmate, gs.stalemate) == flags, fen
+    assert gs.getFen() == fen
+
+
+@pytest.mark.parametrize("bitboard", [False, True])
+def testPickerYieldsTheValidMoves(bitboard):
+    rng = random.Random(25)
+    for fen in FENS:
+        gs = Perft.newGameState(fen, bitboard)
+        for attempt in range(4):
+            checkPicker(gs, rng)
+    for game in range(4):
+        gs = Perft.newGameState(Perft.STARTPOS, bitboard)
+        for ply in range(60):
+            checkPicker(gs, rng)
+            moves = gs.getValidMoves()
+            if len(moves) == 0:
+                break
+            gs.makeMove(rng.choice(moves))
@@ -0,0 +1,42 @@
+import pytest
+
+import ChessEngine
+import SmartMoveFinder
+
+FENS = [
+    "r1bqkb1r/pppp1ppp/2n2n2/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w - - 4 4",
+    "r2q1rk1/ppp2ppp/2np1n2/2b1p1B1/2B1P1b1/2NP1N2/PPP2PPP/R2Q1RK1 w - - 0 8",
+    "8/8/4k3/8/2p5/8/1P3K2/8 w - - 0 1",
+]
+
+
+@pytest.fixture
+def plainSearch(monkeypatch):
+    """
+    Book off and no window dependent pruning: the settings under which the root split searches the same tree.
+    """
+    monkeypatch.setattr(SmartMoveFinder, "openingBook", None)
+    monkeypatch.setattr(SmartMoveFinder, "openingBookLoaded", True)
+    monkeypatch.setattr(SmartMoveFinder, "useNullMove", False)
+    monkeypatch.setattr(SmartMoveFinder, "useLateMoveReductions", False)
+    yield
+    SmartMoveFinder.closeWorkerPool()
+
+
+@pytest.mark.parametrize("fen", FENS)
+def testParallelMatchesSerial(plainSearch, fen):
+    gs = ChessEngine.GameState(fen)
+    SmartMoveFinder.transpositionTable.clear()
+    serialMove, stats = SmartMoveFinder.findBestMoveWithStats(gs, gs.getValidMoves(), 3)
+    serialScore = stats.score
+    SmartMoveFinder.transpositionTable.clear()
+    parallelMove, stats = SmartMoveFinder.findBestMoveWithStats(gs, gs.getValidMoves(), 3, workers=2)
+    assert (parallelMove, stats.score) == (serialMove, serialScore)
+
+
+def testParallelKeepsToNodeLimit(plainSearch):
+    gs = ChessEngine.GameState(FENS[1])
+    validMoves = gs.getValidMoves()
+    move, stats = SmartMoveFinder.findBestMoveWithStats(gs, validMoves, nodeLimit=20000, workers=2)
+    assert move is not None
+    assert stats.nodes <= 20000 + len(validMoves)                   # a task may finish the node that used up its share
@@ -0,0 +1,23 @@
+import pytest
+
+import Perft
+
+
+@pytest.mark.parametrize("bitboard", [False, True])
+@pytest.mark.parametrize("processes", [1, 2])
+@pytest.mark.parametrize("name, fen, depth", [
+    ("start position", Perft.STARTPOS, 3),
+    ("castled middlegame", Perft.POSITIONS[2][1], 2),
+])
+def testDivideSumsToPerft(name, fen, depth, processes, bitboard):
+    gs = Perft.newGameState(fen, bitboard)
+    fenBefore = gs.getFen()
+    results = Perft.divide(gs, depth, processes)
+    assert gs.getFen() == fenBefore                                 # every root move is undone
+    assert sum(count for move, count in results) == Perft.perft(Perft.newGameState(fen, bitboard), depth)
+
+
+@pytest.mark.parametrize("bitboard", [False, True])
+def testDivideMatchesPublishedCount(bitboard):
+    gs = Perft.newGameState(Perft.STARTPOS, bitboard)
+    assert sum(count for move, count in Perft.divide(gs, 3, processes=2)) == 8902
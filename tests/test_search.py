@@ -0,0 +1,22 @@
+import ChessEngine
+import SmartMoveFinder
+
+
+def testRootInCheckOnEveryIteration(monkeypatch):
+    """
+    The root's moves are generated once, before the first iteration; the later iterations must still see the root
+    in check (no late move reductions there), not the flags the last searched position left behind.
+    """
+    monkeypatch.setattr(SmartMoveFinder, "openingBook", None)
+    monkeypatch.setattr(SmartMoveFinder, "openingBookLoaded", True)
+    gs = ChessEngine.GameState("rnbqkbnr/ppp2ppp/8/1B1pp3/4P3/8/PPPP1PPP/RNBQK1NR b - - 0 1")
+    rootLength = len(gs.movelog)
+    rootFlags = []
+    lateMoveReduction = SmartMoveFinder.lateMoveReduction
+    def recordRootFlag(gs, move, depth, moveNumber, inCheck, killers):
+        if len(gs.movelog) == rootLength + 1:
+            rootFlags.append((depth, inCheck))
+        return lateMoveReduction(gs, move, depth, moveNumber, inCheck, killers)
+    monkeypatch.setattr(SmartMoveFinder, "lateMoveReduction", recordRootFlag)
+    SmartMoveFinder.findBestMove(gs, gs.getValidMoves(), 4)
+    assert sorted(set(rootFlags)) == [(depth, True) for depth in range(1, 5)]